@@ -0,0 +1,66 @@
+#############################################################################################
+###COMPACT SEGMENTATION RESULT OF A SINGLE BONE###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+
+class BoneResult(object):
+    """Segmentation of a single bone stored as a bit-packed mask of just its bounding box along
+    with the voxel index of the first corner of the box in the original image. This is what the
+    segmentation sends back from the worker processes (a few KB instead of a full size label image).
+    The full size label map is only created when asked for (see GetLabelImage)."""
+    def __init__(self, bone, label, lowerIndex, mask, spacing):
+        # mask is a numpy array (indexed z,y,x) of the crop starting at lowerIndex (x,y,z). Anything non-zero is the bone
+        self.bone = bone
+        self.label = label
+        self.spacing = tuple(float(i) for i in spacing)
+
+        mask = np.asarray(mask) != 0
+
+        # Shrink the crop (the search window) down to the bounding box of the bone
+        if mask.any():
+            nonzero = [np.flatnonzero(mask.any(axis=axes)) for axes in [(1,2), (0,2), (0,1)]]
+            first = [int(i[0]) for i in nonzero]
+            last = [int(i[-1]) + 1 for i in nonzero]
+        else:
+            first = last = [0,0,0]
+        mask = mask[first[0]:last[0], first[1]:last[1], first[2]:last[2]]
+
+        self.lowerIndex = [int(lowerIndex[i]) + first[2-i] for i in range(3)] # x,y,z
+        self.size = list(mask.shape[::-1]) # x,y,z
+        self.voxelCount = int(np.count_nonzero(mask))
+        self.packedMask = np.packbits(mask, axis=None)
+
+    def GetUpperIndex(self):
+        # Index one past the last voxel of the bounding box (x,y,z)
+        return [self.lowerIndex[i] + self.size[i] for i in range(3)]
+
+    def GetMask(self):
+        # Binary (0 or 1) uint8 array of the bounding box (indexed z,y,x)
+        count = int(np.prod(self.size))
+        return np.unpackbits(self.packedMask, axis=None)[:count].reshape(self.size[::-1])
+
+    def GetLabelArray(self):
+        # Array of the bounding box with the label of the bone (indexed z,y,x)
+        return self.GetMask()*np.uint8(self.label)
+
+    def GetVolume(self):
+        # Volume of the bone in mm^3
+        return self.voxelCount*float(np.prod(self.spacing))
+
+    def GetStatistics(self):
+        return {'bone':self.bone, 'label':self.label, 'voxels':self.voxelCount, 'volume':self.GetVolume(),
+            'lowerIndex':self.lowerIndex, 'size':self.size,
+            'size_mm':[self.size[i]*self.spacing[i] for i in range(3)]}
+
+    def GetLabelImage(self, referenceImage):
+        # Full size label image (uint8) with the same information as referenceImage (e.g. the MRI)
+        image = sitk.Image(referenceImage.GetSize(), sitk.sitkUInt8)
+        image.CopyInformation(referenceImage)
+        if self.voxelCount == 0:
+            return image
+
+        labelImage = sitk.GetImageFromArray(self.GetLabelArray())
+        return sitk.Paste(image, labelImage, self.size, [0,0,0], self.lowerIndex)
@@ -0,0 +1,1983 @@
+#############################################################################################
+###BONE SEGMENTATION CLASS###
+#############################################################################################
+
+# The segmentation method only depends on SimpleITK and NumPy (no 3D Slicer or Qt) so it can be
+# imported in a plain Python interpreter, the command line batch mode, and the worker processes
+
+import SimpleITK as sitk
+import numpy as np
+
+import timeit
+
+from WRISTLib.AnatomicPriors import GetAnatomicPrior, GetBoneLabel
+from WRISTLib.SharedMemory import SharedVolume
+from WRISTLib.PreprocessingCache import DefaultPreprocessingCache, DefaultDiffusionCache, ImageFingerprint
+from WRISTLib.IntensityStatistics import ArrayStatistics, ImageStatistics
+from WRISTLib.MemoryProfile import MemoryProfile
+from WRISTLib.BoneResult import BoneResult
+from WRISTLib.EdgePotential import EdgePotentialMap, EdgePotentialModes
+from WRISTLib.LevelSetInitialization import EllipsoidLevelSet, MaskLevelSet
+from WRISTLib.LevelSetEngines import GetLevelSetEngine
+
+
+class BoneSeg(object):
+    """Class of BoneSegmentation. REQUIRED: BoneSeg(MRI_Image,SeedPoint)"""
+    def Execute(self, original_image, original_seedPoint, verbose=False, returnSitkImage=True, convertSeedPhyscialFlag=True, returnCroppedImage=False):
+
+
+        start_time = timeit.default_timer()
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        self.verbose = verbose # Optional argument to output text to terminal
+
+        self.SetInput(original_image)
+        self.seedPoint = original_seedPoint
+
+        # Check the level set engine of the bone can be used before doing any work (see CanUseLevelSetEngine)
+        self.GetLevelSetEngine()
+        self.convertSeedPhyscialFlag = convertSeedPhyscialFlag
+        self.returnSitkImage = returnSitkImage        
+        self.returnCroppedImage = returnCroppedImage # Return only the cropped segmentation and its location
+
+        if self.profile_memory == True:
+            self.memory_profile.Start()
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        # Define what the anatimical prior volume and bounding box is for each carpal bone
+        self.DefineAnatomicPrior()
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[94m' + "Current Seed Point: "),
+            print(self.seedPoint)
+            print(' ')
+            print('\033[94m' + "Rounding and converting to voxel domain: "), 
+
+        # Convert the seed point to image coordinates (from physical) if needed and round
+        self.RoundSeedPoint()
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[94m' + 'Estimating upper sigmoid threshold level')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        # Estimate the threshold level by image intensity statistics
+        # Skip if the user selected a lower threshold already
+        if self.SkipTresholdCalculation == False:               
+            LowerThreshold = self.EstimateSigmoid()
+            if self.verbose == True:
+                print(' ')
+                print('\033[94m' + 'LowerThreshold:' + str(LowerThreshold))
+            self.SetLevelSetLowerThreshold(LowerThreshold)
+
+        # Crop the image so that it considers only a search space around the seed point
+        # to speed up computation significantly!
+        if self.verbose == True:
+            print(' ')
+            print('\033[94m' + 'Cropping image')
+        self.CropImage()
+        # sitk.Show(self.image, 'Post-cropping')
+        self.MeasureMemory('Crop')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+
+        # Multi-resolution: segment a down sampled crop first and refine the result at the full resolution (see RefineSegmentation)
+        self.preprocessingScale = [1,1,1]
+        if max(self.ScalingFactor) > 1:
+            if self.verbose == True:
+                print(' ')
+                print('\033[94m' + 'Down sampling the image by ' + str(self.ScalingFactor))
+            self.ScaleDownCrop()
+
+        # Re-use the filtered image and edge map if this crop was already preprocessed (e.g. re-running with new level set parameters)
+        cached = self.LoadPreprocessing()
+
+        if cached == False:
+            if self.verbose == True:
+                print(' ')
+                print('\033[94m' + 'Applying Anisotropic Filter')
+            self.apply_AnisotropicFilter()
+            # sitk.Show(self.image, 'Post-Anisotropic')
+            self.MeasureMemory('Anisotropic filter')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.verbose == True:
+            elapsed = timeit.default_timer() - start_time
+            print(' ')
+            print("Elapsed Time (Preprocessing ):" + str(round(elapsed,3)))
+    
+        # Preprocess the level set (only need to do this once)
+        if cached == False:
+            if self.verbose == True:
+                print(' ')
+                print('\033[94m' + 'Preprocess Level Set')
+            self.PreprocessLevelSet()
+            self.StorePreprocessing()
+            self.MeasureMemory('Edge potential map')
+
+        # If the Show Edgemap checkmark is checked then show each edgemap for each bone (e.g. in 3D Slicer) for visualization
+        if self.show_edgemap == True and self.edgemap_callback is not None:
+            self.edgemap_callback(self.EdgePotentialMap, self.current_bone)
+
+        # Initialize the level set (creates the image for saving the levelset using the seed location)
+        if self.verbose == True:
+            print(' ')
+            print('\033[94m' + 'Initializing the Level Set')
+        self.InitializeLevelSet()
+        self.MeasureMemory('Initialize level set')
+
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+
+        if self.SegmentationMode == 'region-growing':
+            if self.verbose == True:
+                print(' ')
+                print('\033[90m' + "Confidence connected region growing...")
+            self.RegionGrowing()
+            self.MeasureMemory('Region growing')
+        else:
+            if self.verbose == True:
+                print(' ')
+                print('\033[90m' + "Sigmoid " + self.GetLevelSetEngine().name + " level set by iteration...")
+            self.SigmoidLevelSetIterations()
+            self.MeasureMemory('Level set')
+        
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[96m' + "Finished with seed point "),
+            print(self.seedPoint)
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[93m' + "Running Leakage Check...")
+        # Don't run leakage check if relaxation is 100%
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.AnatomicalRelaxation != 1 and self.SegmentationMode == 'region-growing':
+            # The region growing has no level set iterations to search, so the confidence multiplier is searched instead
+            self.RegionGrowingCheck()
+            self.MeasureMemory('Leakage check')
+        elif self.AnatomicalRelaxation != 1:
+            # Initilize a variable to hold the number of iterations of the 
+            # leakage check run
+            self.LeakageCheck_iterations = 0
+            # Save the seed point location now (possibly needed for finding a random seed location later)
+            self.seedPoint_converted = self.seedPoint 
+
+            self.LeakageCheck()
+
+            # Free the stored level sets
+            self.levelSetStates = []
+            self.checkpoints = []
+            self.MeasureMemory('Leakage check')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.fullResolutionImage is not None:
+            if self.verbose == True:
+                print(' ')
+                print('\033[93m' + "Refining the Segmentation at Full Resolution...")
+            self.RefineSegmentation()
+            self.MeasureMemory('Full resolution refinement')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        # if self.verbose == True:
+        #     print(' ')
+        #     print('\033[93m' + "Filling Any Holes...")
+        # Fill holes prior to uncropping image for much faster computation
+        # self.HoleFilling()
+
+        # if self.verbose == True:
+        #     print(' ')
+        #     print('\033[93m' + "Smoothing Label...")
+        # self.SmoothLabel()
+
+        # Dilating by same radius if the user selected the checkmark in the GUI
+        if self.DilateImage == True:
+            if self.verbose == True:
+                print(' ')                      
+                print('\033[93m' + "Dilating the Segmentation...")
+
+            self.dilateFilter.SetKernelRadius(1)
+            self.segImg = self.dilateFilter.Execute(self.segImg)
+
+
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[93m' + "Changing Label Value...")
+        self.ChangeLabelValue()
+        self.MeasureMemory('Label value')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.returnCroppedImage == True:
+            # Return only the bounding box of the segmentation as a bit-packed mask along with the
+            # voxel index of its first corner in the original image (much less to send between processes)
+            result = BoneResult(self.current_bone, GetBoneLabel(self.current_bone), self.cropLowerIndex,
+                        sitk.GetArrayViewFromImage(self.segImg), self.segImg.GetSpacing())
+            self.ReportMemory()
+
+            return result
+
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[90m' + "Uncropping Image...")
+        self.UnCropImage()
+        self.MeasureMemory('Uncrop')
+        self.ReportMemory()
+        
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[97m' + "Exporting Final Segmentation...")
+            print(' ')
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        if self.returnSitkImage == True:                
+            # Check the image type first
+            self.segImg = sitk.Cast(self.segImg, original_image.GetPixelID())
+
+            # Return a SimpleITK type image
+            return  self.segImg 
+        else:
+            # Return a numpy array image (needed for using multiple logical cores)
+            self.segImg = sitk.Cast(self.segImg, sitk.sitkUInt8)
+            npImg = sitk.GetArrayFromImage(self.segImg)
+
+            return  npImg
+
+    def SetInput(self, original_image):
+        # Image to segment (a SimpleITK image, a numpy array, or a SharedVolume)
+        self.image = original_image
+        self.original_image = original_image
+        self.original_input = original_image # Used for the preprocessing cache key (see LoadPreprocessing)
+        self.image_key = self.input_fingerprint # Computed from original_input when needed if not given
+        self.fullResolutionImage = None
+
+        if isinstance(original_image, SharedVolume):
+            # The image is in shared memory (from the Multiprocessor class)
+            # Only the cropped region around the seed point is read from it (see CropImage)
+            self.shared_volume = original_image
+        else:
+            self.shared_volume = None
+
+            if not isinstance(self.image, sitk.Image):
+                # Convert from numpy array to a SimpleITK image type first
+                self.image = sitk.GetImageFromArray(self.image)
+                self.original_image = self.image # original_image needs to be a SimpleITK image type for later
+                self.original_input = self.image
+
+            # Only the cropped image is cast to float 32 (see CropImage) instead of copying the whole image
+
+    def PreprocessUnion(self, original_image, seedPoints, bones, verbose=False):
+        ''' Filter the image and create the edge map once over the union of the search windows of all of the
+        bones (seedPoints in voxel coordinates) and store it in the preprocessing cache, so the crop of each
+        bone is sliced out of it instead of filtering the overlapping windows again (see LoadPreprocessing).
+        This is an approximation: the diffusion of a crop depends on the whole crop, so the slice differs from
+        filtering the window of the bone on its own. The slices are used until PreprocessingUnion is reset to None.
+        The bone specific parameters (e.g. the gender) need to be set first. Returns False if the bones can't 
+        share the preprocessing (no preprocessing cache, multi-resolution, or a sigmoid threshold for each bone) '''
+        self.PreprocessingUnion = None
+        if self.preprocessing_cache is None or max(self.ScalingFactor) > 1:
+            return False
+        if self.SkipTresholdCalculation == False and self.SigmoidEstimation == 'roi':
+            return False
+
+        self.verbose = verbose
+        self.SetInput(original_image)
+        self.convertSeedPhyscialFlag = False
+        self.preprocessingScale = [1,1,1]
+        currentBone = self.current_bone
+
+        # Union of the crops of all of the bones (see CropImage)
+        lowerIndex = upperIndex = None
+        for seedPoint, bone in zip(seedPoints, bones):
+            self.SetCurrentBone(bone)
+            self.DefineAnatomicPrior()
+            self.seedPoint = [seedPoint]
+            self.RoundSeedPoint()
+            self.FindCropBounds()
+
+            if lowerIndex is None:
+                lowerIndex, upperIndex = self.cropLowerIndex, self.cropUpperIndex
+            else:
+                lowerIndex = np.minimum(lowerIndex, self.cropLowerIndex).tolist()
+                upperIndex = np.maximum(upperIndex, self.cropUpperIndex).tolist()
+
+        self.SetCurrentBone(currentBone)
+
+        if self.SkipTresholdCalculation == False:
+            self.SetLevelSetLowerThreshold(self.EstimateSigmoid()) # The same for all of the bones
+
+        self.cropLowerIndex, self.cropUpperIndex = lowerIndex, upperIndex
+        if self.LoadPreprocessing() == False:
+            if self.verbose == True:
+                print(' ')
+                print('\033[94m' + 'Preprocessing the union of the search windows from ' + str(lowerIndex) + ' to ' + str(upperIndex))
+
+            self.ExtractCrop()
+            self.apply_AnisotropicFilter()
+            self.PreprocessLevelSet()
+
+        # Store it even if it was cached (it may have only been in memory and not in the disk cache of the worker processes)
+        self.StorePreprocessing()
+        self.PreprocessingUnion = (lowerIndex, upperIndex)
+
+        # Free the filtered images (they are kept in the preprocessing cache)
+        self.image = self.original_image
+        self.EdgePotentialMap = None
+
+        return True
+
+    def ChangeLabelValue(self):
+        # Label value of the current bone (index in the BoneList plus one)
+        ndx = GetBoneLabel(self.current_bone)
+
+        if self.verbose == True:
+            print(' For bone ' + self.current_bone + ' the label is ' + str(ndx))
+
+        # Every non-zero voxel becomes the label (0 stays 0)
+        self.segImg = sitk.BinaryThreshold(self.segImg, 0, 0, 0, ndx)
+
+        return self
+
+    def SmoothLabel(self):
+        # Smooth the segmentation label image to reduce high frequency artifacts on the boundary
+        SmoothFilter = sitk.DiscreteGaussianImageFilter()
+
+        SmoothFilter.SetVariance(0.01)
+
+        self.segImg = SmoothFilter.Execute(self.segImg)
+
+        return self
+
+    def SetDefaultValues(self):
+        # Set the default values of all the parameters here
+        self.SetScalingFactor(1) #X,Y,Z
+       
+        self.SeedListFilename = "PointList.txt"
+        self.SetMaxVolume(300000) #Pixel counts (TODO change to mm^3) 
+
+        # Anisotropic Diffusion Filter
+        self.SetAnisotropicIts(5)
+        self.SetAnisotropicTimeStep(0.02)
+        self.SetAnisotropicConductance(2)
+
+        # Confidence Connected Region Growing (see RegionGrowing)
+        self.SetConfidenceConnectedIts(5)
+        self.SetConfidenceConnectedMultiplier(2.5)
+        self.SetConfidenceConnectedRadius(2)
+
+        # Morphological Operators
+        self.fillFilter.SetForegroundValue(1) 
+        self.fillFilter.FullyConnectedOff()
+        self.SetBinaryMorphologicalRadius(1)
+
+        # Background of 0, foreground of 1, and don't treat the image boundary as foreground
+        for morphologyFilter in [self.dilateFilter, self.erodeFilter]:
+            morphologyFilter.SetBackgroundValue(0)
+            morphologyFilter.SetForegroundValue(1)
+            morphologyFilter.SetBoundaryToForeground(False)
+
+        # Shape Detection Filter
+        self.SetShapeMaxRMSError(0.004)
+        self.SetShapeMaxIterations(400)
+        self.SetShapePropagationScale(4)
+        self.SetShapeCurvatureScale(1)
+
+        # Threshold and Laplacian Level Set Filters (see SetLevelSetEngine)
+        self.SetLevelSetError(0.004)
+        self.SetLevelSetPropagation(1)
+        self.SetLevelSetCurvature(1)
+        self.SetLaplacianError(0.004)
+        self.SetLaplacianExpansionDirection(True) # The level sets are positive inside (as for SetShapePropagationScale)
+
+        # Sigmoid Filter
+        self.sigFilter.SetAlpha(0)
+        self.sigFilter.SetBeta(120)
+        self.sigFilter.SetOutputMinimum(0)
+        self.sigFilter.SetOutputMaximum(255)
+
+        # # If the Flip Sigmoid checkmark was selected flip the values
+        # if self.flip_sigmoid == False:
+        #       self.sigFilter.SetOutputMinimum(0)
+        #       self.sigFilter.SetOutputMaximum(255)
+        # else:
+        #       self.sigFilter.SetOutputMinimum(255)
+        #       self.sigFilter.SetOutputMaximum(0)              
+
+        # Search Space Window
+        # self.SetSearchWindowSize(50)
+
+        # Set current bone and patient gender group
+        self.SetCurrentBone('Capitate')
+        self.SetPatientGender('Unknown')
+
+        # Set the relaxation on the prior anatomical knowledge contraint
+        self.SetAnatomicalRelaxation(0.15)
+
+    def DefineAnatomicPrior(self):
+        # The prior anatomical knowledge on the bone volume and dimensions is addeded
+        # from Crisco et al. Carpal Bone Size and Scaling in Men Versus Women. J Hand Surgery 2005
+
+        self.Prior_Volumes = GetAnatomicPrior(self.PatientGender)
+
+        # Allow some relaxation around the anatomical prior knowledge contraint
+        # Calculate what the ranges should be for each measure using average and standard deviation and relaxation term
+        self.lower_range_volume = (self.Prior_Volumes[self.current_bone + '-vol'][0] - self.Prior_Volumes[self.current_bone + '-vol'][1])*(1-self.AnatomicalRelaxation)
+        self.upper_range_volume = (self.Prior_Volumes[self.current_bone + '-vol'][0] + self.Prior_Volumes[self.current_bone + '-vol'][1])*(1+self.AnatomicalRelaxation)
+
+        self.lower_range_x = (self.Prior_Volumes[self.current_bone + '-x'][0] - self.Prior_Volumes[self.current_bone + '-x'][1])*(1-self.AnatomicalRelaxation)
+        self.upper_range_x = (self.Prior_Volumes[self.current_bone + '-x'][0] + self.Prior_Volumes[self.current_bone + '-x'][1])*(1+self.AnatomicalRelaxation)
+
+        self.lower_range_y = (self.Prior_Volumes[self.current_bone + '-y'][0] - self.Prior_Volumes[self.current_bone + '-y'][1])*(1-self.AnatomicalRelaxation)
+        self.upper_range_y = (self.Prior_Volumes[self.current_bone + '-y'][0] + self.Prior_Volumes[self.current_bone + '-y'][1])*(1+self.AnatomicalRelaxation)
+
+        self.lower_range_z = (self.Prior_Volumes[self.current_bone + '-z'][0] - self.Prior_Volumes[self.current_bone + '-z'][1])*(1-self.AnatomicalRelaxation)
+        self.upper_range_z = (self.Prior_Volumes[self.current_bone + '-z'][0] + self.Prior_Volumes[self.current_bone + '-z'][1])*(1+self.AnatomicalRelaxation)
+
+        # Use the bounding box ranges to create a suitable search window (mm) for the current particular carpal bone 
+        self.searchWindow = np.rint(np.asarray([self.upper_range_x, self.upper_range_y, self.upper_range_z]))
+
+        # Make the search window larger since the seed location won't be exactly in the center of the bone
+        # (this is the width of the window, it is converted to voxels around the seed point in GetCropBounds)
+        self.searchWindow = np.rint((2+self.AnatomicalRelaxation*2)*self.searchWindow)
+
+        if self.verbose == True:
+            print('\033[93m'  + 'Estimated Search Window is ' + str(self.searchWindow) + ' mm')
+            print(' ')
+
+        return self
+
+    def ConnectedComponent(self):
+
+        self.segImg = sitk.Cast(self.segImg, 1) #Can't be a 32 bit float
+        # self.segImg.CopyInformation(segmentation)
+
+        # Try to remove leakage areas by first eroding the binary and
+        # get the labels that are still connected to the original seed location
+
+        # self.segImg = self.erodeFilter.Execute(self.segImg, 0, 1, False)
+
+        # self.segImg = self.connectedComponentFilter.Execute(self.segImg)
+
+        # nda = sitk.GetArrayFromImage(self.segImg)
+        # nda = np.asarray(nda)
+
+        # # In numpy an array is indexed in the opposite order (z,y,x)
+        # tempseedPoint = self.seedPoint[0]
+        # val = nda[tempseedPoint[2]][tempseedPoint[1]][tempseedPoint[0]]
+
+        # # Keep only the label that intersects with the seed point
+        # nda[nda != val] = 0 
+        # nda[nda != 0] = 1
+
+        # self.segImg = sitk.GetImageFromArray(nda)
+
+        # Undo the earlier erode filter by dilating by same radius
+        # self.dilateFilter.SetKernelRadius(3)
+        # self.segImg = self.dilateFilter.Execute(self.segImg, 0, 1, False)
+
+        self.segImg = self.fillFilter.Execute(self.segImg)
+
+        # self.segImg = self.erodeFilter.Execute(self.segImg, 0, 1, False)
+
+        
+
+        return self
+
+    def HoleFilling(self):
+        # Cast to 16 bit (needed for the fill filter to work)
+        self.segImg  = sitk.Cast(self.segImg, sitk.sitkUInt16)
+
+        self.dilateFilter.SetKernelRadius(2)
+        self.segImg = self.dilateFilter.Execute(self.segImg)
+        self.segImg = self.fillFilter.Execute(self.segImg)
+        self.segImg = self.erodeFilter.Execute(self.segImg)
+
+        return self
+
+    def FindNewSeed(self):
+        # Find a new seed location nearby the current seed and within a 3 by 3 cube
+        # TO DO: Which is also within the expected bone intensity range (as defined by the sigmoid threshold)
+
+        # np.random.randint(6, size=3) gives a vector of 3 between 0 and 6
+        # Subtract 3 from each gives a random integer between -3 and 3
+        # Move the original seed point by this amount
+        self.seedPoint = [self.seedPoint_converted[0] + self.random_state.randint(6, size=3) - [3,3,3]]
+
+        
+        # Use the new seed to re-create the level set empty image to save the segmentation
+        self.InitializeLevelSet()
+
+    def LeakageCheck(self):
+        # Check the image type of self.segImg and image are the same (for Python 3.3 and 3.4)
+        # self.segImg = sitk.Cast(self.segImg, segmentation.GetPixelID()) #Can't be a 32 bit float
+        # self.segImg.CopyInformation(segmentation)
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        # Keep track of how many times the LeakageCheck has been run
+        self.LeakageCheck_iterations = self.LeakageCheck_iterations + 1
+
+
+        # If the LeakageCheck has ran more than 5 times choose a new seed location
+        # Within a 3 by 3 cube of the current seed location
+        if self.LeakageCheck_iterations >= 50000:
+            # Find a new nearby seed location
+            self.FindNewSeed()
+
+            # The level set was re-initialized at the new seed location (see InitializeLevelSet)
+            self.levelSetStates = [(0, self.init_ls)]
+
+            # Reset the leakage check iteration number to repeat this process every 5 interations
+            self.LeakageCheck_iterations = 0
+
+        # Fill any segmentation holes first
+        start_time = timeit.default_timer() 
+
+        elapsed = timeit.default_timer() - start_time
+
+        if self.verbose == True:
+            print(' ')
+            print('FILLING elapsed : ' + str(round(elapsed,3)))
+            print(' ')
+               
+        volume, x_size, y_size, z_size = self.MeasureSegmentation(self.segImg)
+
+        # Check to see if the stop button has been pressed
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            return
+
+        # Create a flag to determine whether the test failed
+        # convergence_flag = 0 (passed), 1 (too large), 2 (too small)
+        convergence_flag = 0
+
+
+        if self.verbose == True:
+            print('x_size = ' + str(x_size))
+            print('y_size = ' + str(y_size))
+            print('z_size = ' + str(z_size))
+            print('volume = ' + str(volume))
+
+        if (volume > self.lower_range_volume) and (volume < self.upper_range_volume):
+            if self.verbose == True:
+                print('\033[97m' + "Passed with volume " + str(volume))                
+        else:
+            # Determine whether the segmentation was too large or too small
+            if volume > self.upper_range_volume:
+                convergence_flag = 1
+            elif volume < self.lower_range_volume:
+                convergence_flag = 2
+
+            if self.verbose == True:
+                print('\033[96m' + "Failed with volume " + str(volume))
+                print('Expected range ' + str(self.lower_range_volume) + ' to ' + str(self.upper_range_volume))
+      
+        if (x_size > self.lower_range_x) and (x_size < self.upper_range_x):             
+            if self.verbose == True:
+                print('\033[97m' + "Passed x-bounding box " + str(x_size))
+        else:
+            if self.verbose == True:
+                print('\033[96m' + "Failed x-bounding box " + str(x_size))
+
+        if (y_size > self.lower_range_y) and (y_size < self.upper_range_y):            
+            if self.verbose == True:
+                print('\033[97m' + "Passed y-bounding box " + str(y_size))
+        else:
+            if self.verbose == True:
+                print('\033[96m' + "Failed y-bounding box " + str(y_size))
+
+        if (z_size > self.lower_range_z) and (z_size < self.upper_range_z):
+            if self.verbose == True:
+                print('\033[97m' + "Passed z-bounding box " + str(z_size))
+        else:
+            if self.verbose == True:
+                print('\033[96m' + "Failed z-bounding box " + str(z_size))
+                print('Expected range ' + str(self.lower_range_z) + ' to ' + str(self.upper_range_z))
+
+
+        if convergence_flag != 0 and self.LeakageSearch == 'checkpoint':
+            # Evolve the level set once with snapshots instead of re-running it with random iterations
+            self.CheckpointSearch(convergence_flag)
+            return self
+
+        if convergence_flag == 1:
+            # Segmentation was determined to be much too large. Lower number of iterations
+            print(' ')
+            print(' ')
+            print('REDOING SEGMENTATION')
+
+            # Check to see if the stop button has been pressed
+            self.ProcessEvents()
+            if self.stop_segmentation == True:
+                return
+
+
+            # Shape Detection Filter
+            print('Current iterations = ' + str(self.GetShapeMaxIterations()))
+            
+            # Use 50% less iterations as currently used (since too large of a segmentation)
+            # Use a random percent less iterations (between 10% and 60%) 
+            # as are currently used (since too small of a segmentation)
+            
+            MaxIts = np.rint(self.GetShapeMaxIterations()*(1 - (self.random_state.rand()+0.10)/2))
+            print('Decreasing iterations to = ' + str(MaxIts))
+            self.SetShapeMaxIterations(MaxIts)
+
+            if MaxIts < 10:
+                print('Max Iterations of ' + str(MaxIts) + ' is too low! Stopping now.')
+                return self
+
+            # Don't need to redo the pre-processing steps
+            start_time = timeit.default_timer() 
+            self.ResumeLevelSet(MaxIts)
+            elapsed = timeit.default_timer() - start_time
+
+            if self.verbose == True:
+                print('\033[92m' + 'Elapsed Time (processedImage):' + str(round(elapsed,3)))
+
+            # Redo the leakage check (basically iteratively)
+            self.LeakageCheck()
+
+
+        elif convergence_flag == 2:
+            # Segmentation was determined to be much too small. Increase number of iterations
+            print(' ')
+            print(' ')
+            print('REDOING SEGMENTATION')
+
+            # Check to see if the stop button has been pressed
+            self.ProcessEvents()
+            if self.stop_segmentation == True:
+                return
+
+            # Use a random percent more iterations (between 20% and 200%) 
+            # as are currently used (since too small of a segmentation)
+            MaxIts = np.rint(self.GetShapeMaxIterations()*(1 + (self.random_state.rand()+0.10)/2))
+
+            print('Increasing iterations to = ' + str(MaxIts))
+            self.SetShapeMaxIterations(MaxIts)
+
+            # Don't need to redo the pre-processing steps
+            start_time = timeit.default_timer() 
+            self.ResumeLevelSet(MaxIts)
+            elapsed = timeit.default_timer() - start_time
+            
+            if self.verbose == True:
+                print('\033[92m' + 'Elapsed Time (processedImage):' + str(round(elapsed,3)))
+           
+            if MaxIts > 3000:
+                print('Max Iterations of ' + str(MaxIts) + ' is too high! Stopping now.')
+                return self
+
+
+            # Redo the leakage check (basically iteratively) using the new parameters
+            self.LeakageCheck()
+
+
+
+        return self
+
+    def MeasureSegmentation(self, segImg):
+        ' Volume (mm^3) and bounding box size (mm) of a binary segmentation '
+        pix_dims = np.asarray(segImg.GetSpacing()) # (may be down sampled, see ScaleDownCrop)
+
+        # Label Statistics Image Filter can't be 32-bit or 64-bit float
+        if segImg.GetPixelID() in [sitk.sitkFloat32, sitk.sitkFloat64]:
+            segImg = sitk.Cast(segImg, sitk.sitkUInt8)
+
+        BoundingBoxFilter = sitk.LabelStatisticsImageFilter()
+        BoundingBoxFilter.Execute(segImg, segImg)
+
+        label = 1 # Only considering one bone in the segmentaiton for now
+
+        if not BoundingBoxFilter.HasLabel(label):
+            return 0, 0, 0, 0
+
+        BoundingBox = BoundingBoxFilter.GetBoundingBox(label)
+        # Need to be consistent with how Crisco 2005 defines their bounding box
+        z_size = BoundingBox[1] - BoundingBox[0] 
+        x_size = BoundingBox[3] - BoundingBox[2]
+        y_size = BoundingBox[5] - BoundingBox[4]
+
+        # Convert to physical units (mm)
+        x_size = x_size*pix_dims[0]
+        y_size = y_size*pix_dims[1]
+        z_size = z_size*pix_dims[2]
+
+        volume = np.prod(pix_dims)*BoundingBoxFilter.GetCount(label)
+
+        # Round to the nearest integer
+        x_size = np.around(x_size,1)
+        y_size = np.around(y_size,1)
+        z_size = np.around(z_size,1)
+        volume = np.rint(volume)
+
+        return volume, x_size, y_size, z_size
+
+    def CompareToPrior(self, volume, x_size, y_size, z_size):
+        # convergence_flag = 0 (passed), 1 (too large), 2 (too small) and whether the bounding box is within the prior
+        convergence_flag = 0
+        if volume >= self.upper_range_volume:
+            convergence_flag = 1
+        elif volume <= self.lower_range_volume:
+            convergence_flag = 2
+
+        boundingBoxPassed = ((x_size > self.lower_range_x) and (x_size < self.upper_range_x) and
+                            (y_size > self.lower_range_y) and (y_size < self.upper_range_y) and
+                            (z_size > self.lower_range_z) and (z_size < self.upper_range_z))
+
+        return convergence_flag, boundingBoxPassed
+
+    def EvolveLevelSet(self, initialLevelSet, iterations):
+        ' Run the level set engine of the current bone for a number of iterations starting from initialLevelSet '
+        try:
+            levelSet, elapsed = self.GetLevelSetEngine().Execute(self, initialLevelSet, iterations)
+        except RuntimeError:
+            if self.stop_segmentation == True:
+                return None, 0 # Aborted by the stop button (see OnLevelSetIteration)
+            raise
+
+        return levelSet, elapsed
+
+    def StoreLevelSetState(self, iterations, levelSet):
+        # Keep the level set after a number of iterations so a retry can continue from it (see ResumeLevelSet)
+        self.levelSetStates.append((iterations, levelSet))
+        if len(self.levelSetStates) > self.MaxLevelSetStates:
+            del self.levelSetStates[1] # Always keep the initial level set
+
+    def ResumeLevelSet(self, MaxIts):
+        ''' Segmentation after MaxIts level set iterations. With WarmStart the level set continues from the 
+        stored state with the most iterations up to MaxIts (e.g. the previous result if it was too small)
+        so only the extra iterations are computed. Otherwise the level set is re-run from the seed. '''
+        if self.WarmStart == False:
+            return self.SigmoidLevelSetIterations()
+
+        iterations, levelSet = max([state for state in self.levelSetStates if state[0] <= MaxIts], key=lambda state: state[0])
+
+        if iterations < MaxIts:
+            if self.verbose == True:
+                print('Continuing the level set from ' + str(iterations) + ' iterations')
+
+            levelSet, elapsed = self.EvolveLevelSet(levelSet, MaxIts - iterations)
+            if levelSet is None:
+                return self
+            self.StoreLevelSetState(MaxIts, levelSet)
+
+        self.levelSet = levelSet
+        self.segImg = self.SegToBinary(self.levelSet)
+
+        return self
+
+    def OnLevelSetIteration(self, levelSetFilter):
+        # Called by SimpleITK after every iteration of the level set filters
+        # so the stop button works in the middle of a long level set evolution
+        self.ProcessEvents()
+        if self.stop_segmentation == True:
+            levelSetFilter.Abort()
+
+    def CreateCheckpoint(self, iterations, levelSet):
+        # Measure the segmentation of the level set after a number of iterations
+        segImg = self.SegToBinary(levelSet)
+        volume, x_size, y_size, z_size = self.MeasureSegmentation(segImg)
+        flag, boundingBoxPassed = self.CompareToPrior(volume, x_size, y_size, z_size)
+
+        return {'iterations':iterations, 'levelSet':levelSet, 'segImg':segImg, 'volume':volume,
+                'size':[x_size, y_size, z_size], 'flag':flag, 'boundingBoxPassed':boundingBoxPassed}
+
+    def EvolveWithCheckpoints(self, levelSet, iterations, maxIterations, interval):
+        ''' Evolve the level set in steps of interval iterations (up to maxIterations) and add a checkpoint
+        to self.checkpoints after each step. Stops early if the level set converged or one of the
+        level_set_observers returns True for the checkpoint. Returns the last checkpoint.
+        SimpleITK can't pause a level set filter and continue it later, so each step runs the filter again
+        starting from the level set of the previous step. The filter rebuilds its narrow band (sparse field)
+        and resets its RMS change from that level set, so the result after N iterations differs slightly
+        from N iterations in one run (see SetLeakageSearch and SetEarlyStopping) '''
+        checkpoint = None
+        while iterations < maxIterations:
+            steps = int(min(interval, maxIterations - iterations))
+            levelSet, elapsed = self.EvolveLevelSet(levelSet, steps)
+            if levelSet is None:
+                return None
+
+            iterations = iterations + elapsed
+            checkpoint = self.CreateCheckpoint(iterations, levelSet)
+            self.checkpoints.append(checkpoint)
+
+            if self.verbose == True:
+                print('Checkpoint at ' + str(iterations) + ' iterations with volume ' + str(checkpoint['volume']))
+
+            # Check to see if the stop button has been pressed
+            self.ProcessEvents()
+            if self.stop_segmentation == True:
+                return None
+
+            if elapsed < steps:
+                break # Converged
+
+            stop = False
+            for observer in self.level_set_observers:
+                if observer(checkpoint) == True:
+                    stop = True
+            if stop == True:
+                if self.verbose == True:
+                    print('\033[96m' + 'Stopping the level set early at ' + str(iterations) + ' iterations')
+                break
+
+        return checkpoint
+
+    def PriorExceeded(self, checkpoint):
+        # Default level set observer: stop once the segmentation is larger than the anatomical prior
+        # (it only grows from here so there is no need to finish the iterations)
+        x_size, y_size, z_size = checkpoint['size']
+        return (checkpoint['volume'] >= self.upper_range_volume or x_size >= self.upper_range_x or
+                y_size >= self.upper_range_y or z_size >= self.upper_range_z)
+
+    def AddLevelSetObserver(self, observer):
+        # observer(checkpoint) is called every EarlyStoppingInterval iterations (see EvolveWithCheckpoints)
+        # with a dictionary of the current level set, segmentation, volume, and size. Return True to stop the level set.
+        self.level_set_observers.append(observer)
+
+    def CheckpointSearch(self, convergence_flag):
+        ''' Evolve the level set once (in steps of CheckpointIterations), measure the segmentation at each
+        checkpoint, and keep the checkpoint which best agrees with the anatomical prior. If the volume
+        jumps over the prior range between two checkpoints, bisect the iterations between them. '''
+        initial = {'iterations':0, 'levelSet':self.init_ls, 'segImg':None, 'volume':0, 'flag':2, 'boundingBoxPassed':False}
+
+        if convergence_flag == 2:
+            # Too small, so keep evolving the current result (the earlier iterations are all too small)
+            current = {'iterations':self.GetShapeMaxIterations(), 'levelSet':self.levelSet, 'segImg':None, 'volume':0, 'flag':2, 'boundingBoxPassed':False}
+            if len(self.checkpoints) > 0:
+                current = self.checkpoints[-1]
+            self.checkpoints = [current]
+            self.EvolveWithCheckpoints(current['levelSet'], current['iterations'], self.MaxSearchIterations, self.CheckpointIterations)
+        elif len(self.checkpoints) > 0:
+            # Too large, but the level set was already evolved with checkpoints (see SetEarlyStopping)
+            self.checkpoints.insert(0, initial)
+        else:
+            # Too large, so start over from the initial level set
+            self.checkpoints = [initial]
+            self.EvolveWithCheckpoints(self.init_ls, 0, self.MaxSearchIterations, self.CheckpointIterations)
+
+        # Check to see if the stop button has been pressed
+        if self.stop_segmentation == True:
+            return
+
+        checkpoints = self.checkpoints
+        passed = [c for c in checkpoints if c['flag'] == 0]
+
+        if len(passed) == 0 and checkpoints[-1]['flag'] == 1:
+            # Bisect between the last checkpoint which was too small and the first which was too large
+            lower = checkpoints[-2]
+            steps = checkpoints[-1]['iterations'] - lower['iterations']
+            while steps > self.MinCheckpointIterations:
+                steps = int(steps/2)
+                levelSet, elapsed = self.EvolveLevelSet(lower['levelSet'], steps)
+                if levelSet is None:
+                    return
+
+                checkpoint = self.CreateCheckpoint(lower['iterations'] + elapsed, levelSet)
+                checkpoints.append(checkpoint)
+
+                if self.verbose == True:
+                    print('Bisection at ' + str(checkpoint['iterations']) + ' iterations with volume ' + str(checkpoint['volume']))
+
+                if checkpoint['flag'] == 0:
+                    passed = [checkpoint]
+                    break
+                elif checkpoint['flag'] == 2:
+                    lower = checkpoint
+
+        # Use the checkpoints within the prior volume range (preferring those also within the bounding box range)
+        # Otherwise use the checkpoint closest to the range
+        candidates = [c for c in passed if c['boundingBoxPassed'] == True]
+        if len(candidates) == 0:
+            candidates = passed
+        if len(candidates) == 0:
+            candidates = [c for c in checkpoints if c['segImg'] is not None]
+        if len(candidates) == 0:
+            return self # Nothing better than the current result
+
+        middle = (self.lower_range_volume + self.upper_range_volume)/2.0
+        best = min(candidates, key=lambda c: abs(c['volume'] - middle))
+
+        if self.verbose == True:
+            print('\033[97m' + 'Using the checkpoint at ' + str(best['iterations']) + ' iterations with volume ' + str(best['volume']))
+
+        self.levelSet = best['levelSet']
+        self.segImg = best['segImg']
+        self.checkpoints = []
+
+        return self
+
+    def RoundSeedPoint(self):
+        tempseedPoint = np.array(self.seedPoint).astype(int) # Just to be safe, make it int again
+        tempseedPoint = tempseedPoint[0]
+
+        # Convert from physical to image domain
+        if self.convertSeedPhyscialFlag == True:
+
+            # Check to see if the seed XY coordinates should be flipped (based on the checkmark in the GUI)
+            if self.flip_seed_XY == False:
+                tempFloat = [float(tempseedPoint[0]), float(tempseedPoint[1]), float(tempseedPoint[2])]
+            else:
+                # The image is not in the standard RAS orientation so the X and Y of the seed coordinates need to
+                # Be flipped (the user has checked the checkmark in the user interface GUI)
+                tempFloat = [float(tempseedPoint[0]), float(tempseedPoint[2]), float(tempseedPoint[1])]
+
+            self.seedPoint = tempFloat
+
+
+            # Need to round the seedPoints because integers are required for indexing
+            # (the seed is scaled down after cropping for the multi-resolution, see ScaleDownCrop)
+            tempseedPoint = np.array(self.seedPoint).astype(int)
+            tempseedPoint = abs(tempseedPoint)
+            tempseedPoint = tempseedPoint.round() # Need to round it again for Python 3.3
+
+        self.seedPoint = [tempseedPoint]
+        self.original_seedPoint = [tempseedPoint]
+
+        if self.verbose == True:
+            print('Seed point (voxel coordinates): ' + str(self.seedPoint[0]))
+
+        return self
+
+    def UnCropImage(self):
+        ' Put the segmentation of the cropped image back into an image the size of the original MRI '
+
+        # Need the location of the cropped volume in the original image (from CropImage)
+        # A single (zero) image of the original size is allocated and the crop is pasted into it
+        image = sitk.Image(self.original_image.GetSize(), self.segImg.GetPixelID())
+
+        if self.shared_volume is not None:
+            self.shared_volume.CopyInformationTo(image)
+        else:
+            image.CopyInformation(self.original_image)
+
+        self.segImg = sitk.Paste(image, self.segImg, self.segImg.GetSize(), [0,0,0], 
+                        [int(i) for i in self.cropLowerIndex])
+
+        return self
+
+    def CropImage(self):
+        ' Crop the input_image around the initial seed point to speed up computation '
+        self.FindCropBounds()
+        self.ExtractCrop()
+
+        # The seed point in the cropped image (in the middle of the search window unless it is at the image border)
+        self.seedPoint = [np.asarray(self.seedPoint[0]) - np.asarray(self.cropLowerIndex)]
+
+        return self
+
+    def GetCropBounds(self):
+        ''' Voxel index of the first corner of the search window around the seed point and the index one past
+        its last corner in the original image. The search window is in mm (see DefineAnatomicPrior) so it 
+        covers the same physical size regardless of the voxel size. At the image borders only the side 
+        outside the image is cut off (the seed point is then not in the middle of the window) '''
+        im_size = np.asarray(self.image.GetSize())
+        seedPoint = np.asarray(self.seedPoint[0]).astype(int)
+
+        # Half of the width of the window in voxels
+        radius = np.ceil(np.asarray(self.searchWindow)/2.0/np.asarray(self.image.GetSpacing())).astype(int)
+
+        lowerIndex = np.clip(seedPoint - radius, 0, im_size)
+        upperIndex = np.clip(seedPoint + radius + 1, lowerIndex, im_size)
+
+        return lowerIndex.tolist(), upperIndex.tolist()
+
+    def FindCropBounds(self):
+        # Save the location of the cropped volume in the original image (for uncropping later)
+        self.cropLowerIndex, self.cropUpperIndex = self.GetCropBounds()
+
+        if self.verbose == True:
+            print('Search window from ' + str(self.cropLowerIndex) + ' to ' + str(self.cropUpperIndex))
+
+        return self
+
+    def ExtractCrop(self):
+        # Crop the image from cropLowerIndex up to cropUpperIndex (as float 32)
+        if self.shared_volume is not None:
+            # Only copy the cropped region out of the shared memory
+            self.image = sitk.Cast(self.shared_volume.GetCrop(self.cropLowerIndex, self.cropUpperIndex), sitk.sitkFloat32)
+        else:
+            cropFilter = sitk.CropImageFilter()
+            cropFilter.SetLowerBoundaryCropSize(self.cropLowerIndex)
+            cropFilter.SetUpperBoundaryCropSize((np.asarray(self.image.GetSize()) - self.cropUpperIndex).astype(int).tolist())
+
+            self.image = sitk.Cast(cropFilter.Execute(self.image), sitk.sitkFloat32)
+
+        return self
+
+    def PreprocessLevelSet(self):
+        # Pre-processing for the level-set (e.g. create the edge map) only need to do once
+        # (sigmoid and edge potential of the gradient, see EdgePotentialMap and SetEdgePotentialMode)
+        if self.verbose == True:
+            start_time = timeit.default_timer() 
+
+        self.EdgePotentialMap = EdgePotentialMap(self.image, self.sigFilter, self.EdgePotentialMode, self.EdgePotentialSigma)
+
+        if self.verbose == True:
+            elapsed = timeit.default_timer() - start_time
+            print('Edge potential map (' + self.EdgePotentialMode + ') of ' + str(int(np.prod(self.image.GetSize()))) +
+                ' voxels in ' + str(round(elapsed,3)) + ' seconds')
+
+    def GetPreprocessingParameters(self):
+        # Everything (besides the image and the crop) which changes the filtered image or the edge map
+        return (self.anisotropicFilter.GetNumberOfIterations(), self.anisotropicFilter.GetTimeStep(),
+            self.anisotropicFilter.GetConductanceParameter(), self.sigFilter.GetAlpha(), self.sigFilter.GetBeta(),
+            self.sigFilter.GetOutputMinimum(), self.sigFilter.GetOutputMaximum(), tuple(self.preprocessingScale),
+            self.EdgePotentialMode, self.EdgePotentialSigma)
+
+    def LoadPreprocessing(self, lowerIndex=None, upperIndex=None):
+        ''' Get the filtered crop and edge map from the preprocessing cache. Returns False if not cached. 
+        The region defaults to the crop of the image (from CropImage) '''
+        if self.preprocessing_cache is None:
+            return False
+
+        if lowerIndex is None:
+            lowerIndex, upperIndex = self.cropLowerIndex, self.cropUpperIndex
+
+        if self.image_key is None:
+            self.image_key = ImageFingerprint(self.original_input)
+
+        cached = self.preprocessing_cache.Lookup(self.image_key, self.GetPreprocessingParameters(),
+            lowerIndex, upperIndex)
+
+        # Otherwise slice the crop out of the shared preprocessing of all the bones (if it contains the crop)
+        union = self.PreprocessingUnion
+        if cached is None and union is not None and np.all(np.asarray(union[0]) <= lowerIndex) and np.all(np.asarray(union[1]) >= upperIndex):
+            cached = self.preprocessing_cache.Lookup(self.image_key, self.GetPreprocessingParameters(),
+                union[0], union[1], (lowerIndex, upperIndex))
+
+        if cached is None:
+            return False
+
+        if self.verbose == True:
+            print(' ')
+            print('\033[94m' + 'Using the cached preprocessing (anisotropic filter and edge map)')
+
+        self.image, self.EdgePotentialMap = cached
+
+        return True
+
+    def StorePreprocessing(self, lowerIndex=None, upperIndex=None):
+        if self.preprocessing_cache is None:
+            return
+
+        if lowerIndex is None:
+            lowerIndex, upperIndex = self.cropLowerIndex, self.cropUpperIndex
+
+        self.preprocessing_cache.Store(self.image_key, self.GetPreprocessingParameters(),
+            lowerIndex, upperIndex, self.image, self.EdgePotentialMap)
+
+    def ScaleDownCrop(self):
+        ' Down sample the cropped image (and seed point) by the ScalingFactor for the first level set pass '
+        self.fullResolutionImage = self.image
+        self.fullResolutionSeedPoint = self.seedPoint
+
+        self.shrinkFilter.SetShrinkFactors(self.ScalingFactor)
+        self.image = self.shrinkFilter.Execute(self.image)
+        self.preprocessingScale = self.ScalingFactor
+
+        # The shrink filter keeps the physical location, so convert the seed through physical coordinates
+        seedPoint = self.fullResolutionImage.TransformIndexToPhysicalPoint(np.asarray(self.seedPoint[0]).astype(int).tolist())
+        self.seedPoint = [np.asarray(self.image.TransformPhysicalPointToIndex(seedPoint))]
+
+        return self
+
+    def RefineSegmentation(self):
+        ''' Up sample the segmentation of the down sampled crop and use it as the initial level set for 
+        RefinementIterations of the level set at the full resolution. Only the region around the
+        segmentation (within RefinementMargin voxels) is filtered and evolved. '''
+        fullImage = self.fullResolutionImage
+
+        # Nearest neighbor up sampling onto the full resolution crop (the expand filter can't be used since 
+        # the shrink filter rounds the image size down)
+        segImg = sitk.Resample(self.segImg, fullImage, sitk.Transform(),
+                    sitk.sitkNearestNeighbor, 0, sitk.sitkUInt8)
+
+        self.image = fullImage
+        self.seedPoint = self.fullResolutionSeedPoint
+        self.fullResolutionImage = None
+        self.preprocessingScale = [1,1,1]
+
+        statistics = sitk.LabelShapeStatisticsImageFilter()
+        statistics.Execute(segImg)
+        if not statistics.HasLabel(1):
+            self.segImg = segImg
+            return self
+
+        # Region around the up sampled segmentation
+        bbox = np.asarray(statistics.GetBoundingBox(1))
+        margin = self.RefinementMargin + max(self.ScalingFactor)
+        lowerIndex = np.maximum(bbox[0:3] - margin, 0)
+        upperIndex = np.minimum(bbox[0:3] + bbox[3:6] + margin, np.asarray(fullImage.GetSize()))
+        size = (upperIndex - lowerIndex).astype(int).tolist()
+        lowerIndex = lowerIndex.astype(int).tolist()
+
+        # Filter the region (in the coordinates of the whole image for the preprocessing cache)
+        self.image = sitk.RegionOfInterest(fullImage, size, lowerIndex)
+        imageLowerIndex = (np.asarray(self.cropLowerIndex) + lowerIndex).tolist()
+        imageUpperIndex = (np.asarray(imageLowerIndex) + size).tolist()
+
+        if self.LoadPreprocessing(imageLowerIndex, imageUpperIndex) == False:
+            self.apply_AnisotropicFilter(imageLowerIndex, imageUpperIndex)
+            self.PreprocessLevelSet()
+            self.StorePreprocessing(imageLowerIndex, imageUpperIndex)
+
+        # Signed distance function of the up sampled segmentation as the initial level set (see InitializeLevelSet)
+        init_ls = MaskLevelSet(sitk.RegionOfInterest(segImg, size, lowerIndex), self.NarrowBand)
+
+        levelSet, elapsed = self.EvolveLevelSet(init_ls, self.RefinementIterations)
+        self.image = fullImage
+        if levelSet is None:
+            return self
+
+        if self.verbose == True:
+            print('Refined the segmentation with ' + str(elapsed) + ' iterations')
+
+        # Put the refined region back into the full resolution crop
+        refined = self.SegToBinary(levelSet)
+        self.segImg = sitk.Image(fullImage.GetSize(), sitk.sitkUInt8)
+        self.segImg.CopyInformation(fullImage)
+        self.segImg = sitk.Paste(self.segImg, refined, size, [0,0,0], lowerIndex)
+
+        return self
+
+    def InitializeLevelSet(self):
+        # Use the seed location (or the initial mask, see SetInitialMask) to initilize the level set image
+        seedPoint = self.seedPoint[0]
+
+        if self.verbose == True:
+            print(seedPoint)
+
+        self.init_ls = None
+        if self.InitialMask is not None:
+            # Nearest neighbor resampling onto the (cropped and maybe down sampled) image
+            mask = sitk.Resample(self.InitialMask, self.image, sitk.Transform(), sitk.sitkNearestNeighbor, 0, sitk.sitkUInt8)
+            if np.any(sitk.GetArrayViewFromImage(mask)):
+                self.init_ls = MaskLevelSet(mask, self.NarrowBand)
+
+        if self.init_ls is None and self.InitialShape == 'prior':
+            self.init_ls = self.PriorLevelSet(seedPoint)
+
+        if self.init_ls is None:
+            # Signed distance function (Float 32) of the InitialRadius voxel ellipsoid around the seed point,
+            # computed directly instead of from the distance map of the dilated seed voxel
+            radii = self.InitialRadius*np.asarray(self.image.GetSpacing())
+            self.init_ls = EllipsoidLevelSet(self.image, np.asarray(seedPoint).astype(int), radii, self.NarrowBand)
+
+        self.segImg = self.SegToBinary(self.init_ls)
+
+    def PriorLevelSet(self, seedPoint):
+        ''' Initial level set of an ellipsoid around the seed point with InitialPriorFraction of the expected x, y, 
+        and z size of the bone (see DefineAnatomicPrior), clipped to the region connected to the seed point 
+        on the same side of the sigmoid threshold. None if the seed point isn't within the image '''
+        seedPoint = np.asarray(seedPoint).astype(int)
+        if np.any(seedPoint < 0) or np.any(seedPoint >= np.asarray(self.image.GetSize())):
+            return None
+
+        extents = np.asarray([self.Prior_Volumes[self.current_bone + '-' + axis][0] for axis in ['x', 'y', 'z']])
+        radii = np.maximum(self.InitialPriorFraction*extents/2, self.InitialRadius*np.asarray(self.image.GetSpacing()))
+        ellipsoid = self.SegToBinary(EllipsoidLevelSet(self.image, seedPoint, radii))
+
+        # Voxels on the same side of the sigmoid threshold as the seed point (bone intensities)
+        sigmoidImage = self.sigFilter.Execute(self.image)
+        threshold = (self.sigFilter.GetOutputMinimum() + self.sigFilter.GetOutputMaximum())/2.0
+        if sigmoidImage.GetPixel(seedPoint.tolist()) > threshold:
+            region = sitk.Greater(sigmoidImage, threshold)
+        else:
+            region = sitk.LessEqual(sigmoidImage, threshold)
+        sigmoidImage = None
+
+        # Only the part of the ellipsoid connected to the seed point
+        mask = sitk.ConnectedThreshold(sitk.And(ellipsoid, region), seedList=[seedPoint.tolist()], lower=1, upper=1)
+
+        if self.verbose == True:
+            print('Initial ellipsoid of ' + str(np.round(radii, 1)) + ' mm (' +
+                str(int(np.count_nonzero(sitk.GetArrayViewFromImage(mask)))) + ' voxels after clipping)')
+
+        return MaskLevelSet(mask, self.NarrowBand)
+
+    def RegionGrowing(self, multiplier=None):
+        ''' Fast segmentation: confidence connected region growing from the seed point within the expected size of
+        the bone around it and hole filling, after which only the boundary band of the result (RegionGrowingBand 
+        voxels on each side) is refined by RegionGrowingIterations of the level set (see RefineBoundaryBand) '''
+        seedPoint = np.asarray(self.seedPoint[0]).astype(int).tolist()
+        if multiplier is None:
+            multiplier = self.ConfidenceConnectedMultiplier
+
+        regionFilter = sitk.ConfidenceConnectedImageFilter()
+        regionFilter.SetSeedList([seedPoint])
+        regionFilter.SetNumberOfIterations(int(self.ConfidenceConnectedIts))
+        regionFilter.SetMultiplier(float(multiplier))
+        regionFilter.SetInitialNeighborhoodRadius(int(self.ConfidenceConnectedRadius))
+        regionFilter.SetReplaceValue(1)
+        segImg = regionFilter.Execute(self.image)
+
+        # The bone can't extend further from the seed point than half of its largest expected size (x, y, z)
+        radii = [self.upper_range_x/2.0, self.upper_range_y/2.0, self.upper_range_z/2.0]
+        segImg = sitk.And(segImg, self.SegToBinary(EllipsoidLevelSet(self.image, seedPoint, radii)))
+        segImg = sitk.ConnectedThreshold(segImg, seedList=[seedPoint], lower=1, upper=1)
+        self.segImg = self.fillFilter.Execute(segImg)
+
+        if self.verbose == True:
+            print('Region growing (multiplier ' + str(round(multiplier,2)) + '): ' +
+                str(int(np.count_nonzero(sitk.GetArrayViewFromImage(self.segImg)))) + ' voxels')
+
+        if self.RegionGrowingIterations > 0:
+            self.RefineBoundaryBand()
+
+        return self
+
+    def RefineBoundaryBand(self):
+        ''' Run RegionGrowingIterations of the level set starting from the region growing result, but only
+        keep its changes within RegionGrowingBand voxels of the boundary (the uncertain part). Only the
+        region around the band is evolved '''
+        radius = [int(self.RegionGrowingBand)]*3
+        dilated = sitk.BinaryDilate(self.segImg, radius)
+        eroded = sitk.BinaryErode(self.segImg, radius)
+
+        statistics = sitk.LabelShapeStatisticsImageFilter()
+        statistics.Execute(dilated)
+        if not statistics.HasLabel(1):
+            return self
+
+        # Region around the band (the level set can't move outside of it anyway)
+        bbox = np.asarray(statistics.GetBoundingBox(1))
+        lowerIndex = np.maximum(bbox[0:3] - 1, 0)
+        upperIndex = np.minimum(bbox[0:3] + bbox[3:6] + 1, np.asarray(self.image.GetSize()))
+        size = (upperIndex - lowerIndex).astype(int).tolist()
+        lowerIndex = lowerIndex.astype(int).tolist()
+
+        image, edgePotentialMap = self.image, self.EdgePotentialMap
+        self.image = sitk.RegionOfInterest(image, size, lowerIndex)
+        self.EdgePotentialMap = sitk.RegionOfInterest(edgePotentialMap, size, lowerIndex)
+        try:
+            initialLevelSet = MaskLevelSet(sitk.RegionOfInterest(self.segImg, size, lowerIndex), self.NarrowBand)
+            levelSet, elapsed = self.EvolveLevelSet(initialLevelSet, self.RegionGrowingIterations)
+        finally:
+            self.image, self.EdgePotentialMap = image, edgePotentialMap
+        if levelSet is None:
+            return self
+
+        if self.verbose == True:
+            print('Refined the boundary band of the region growing with ' + str(elapsed) + ' iterations')
+
+        # Inside of the band from the region growing, within the band from the level set
+        band = sitk.And(sitk.RegionOfInterest(dilated, size, lowerIndex), sitk.Not(sitk.RegionOfInterest(eroded, size, lowerIndex)))
+        refined = sitk.Or(sitk.RegionOfInterest(eroded, size, lowerIndex), sitk.And(self.SegToBinary(levelSet), band))
+
+        segImg = sitk.Image(self.image.GetSize(), sitk.sitkUInt8)
+        segImg.CopyInformation(self.image)
+        self.segImg = sitk.Paste(segImg, sitk.Cast(refined, sitk.sitkUInt8), size, [0,0,0], lowerIndex)
+
+        return self
+
+    def RegionGrowingCheck(self):
+        ''' Anatomical prior check of the region growing: grow again with a smaller (too large) or larger (too small)
+        confidence multiplier until the volume and bounding box are within the prior, at most RegionGrowingRetries
+        times. Keeps the segmentation closest to the prior volume range '''
+        multiplier = float(self.ConfidenceConnectedMultiplier)
+        best, bestError = None, np.inf
+
+        for attempt in range(self.RegionGrowingRetries + 1):
+            self.ProcessEvents()
+            if self.stop_segmentation == True:
+                return
+
+            volume, x_size, y_size, z_size = self.MeasureSegmentation(self.segImg)
+            convergence_flag, boundingBoxPassed = self.CompareToPrior(volume, x_size, y_size, z_size)
+
+            # Relative distance of the volume to the prior range
+            error = max(volume - self.upper_range_volume, 0)/self.upper_range_volume + max(self.lower_range_volume - volume, 0)/self.lower_range_volume
+            if error < bestError:
+                best, bestError = self.segImg, error
+
+            if self.verbose == True:
+                print('Region growing volume ' + str(round(volume,1)) + ' (expected ' + str(round(self.lower_range_volume,1)) +
+                    ' to ' + str(round(self.upper_range_volume,1)) + ')')
+
+            if convergence_flag == 0 and boundingBoxPassed == True:
+                return self
+            if attempt == self.RegionGrowingRetries:
+                break
+
+            tooLarge = convergence_flag == 1 or (convergence_flag == 0 and
+                (x_size >= self.upper_range_x or y_size >= self.upper_range_y or z_size >= self.upper_range_z))
+            multiplier = multiplier*0.8 if tooLarge else multiplier*1.25
+            self.RegionGrowing(multiplier)
+
+        self.segImg = best
+
+        return self
+
+    def SigmoidLevelSetIterations(self):
+        ' Run the Shape Detection Level Set Segmentation Method'
+
+        # sitk.Show(self.init_ls, 'self.init_ls')
+        # sitk.Show(self.EdgePotentialMap, 'self.EdgePotentialMap')
+
+        self.checkpoints = []
+
+        if self.EarlyStoppingInterval > 0 and self.AnatomicalRelaxation != 1:
+            # Check the segmentation every EarlyStoppingInterval iterations and stop once it is too large
+            checkpoint = self.EvolveWithCheckpoints(self.init_ls, 0, self.GetShapeMaxIterations(), self.EarlyStoppingInterval)
+            if checkpoint is None:
+                return self
+            self.levelSet = checkpoint['levelSet']
+        else:
+            self.levelSet, elapsed = self.EvolveLevelSet(self.init_ls, self.GetShapeMaxIterations())
+            if self.levelSet is None:
+                return self
+     
+        if self.verbose == True:
+            print('Done with ShapeDetectionLevelSetImageFilter!')
+
+        # Keep the states of the level set for the retries in the LeakageCheck (see ResumeLevelSet)
+        self.levelSetStates = [(0, self.init_ls)]
+        for checkpoint in self.checkpoints:
+            self.StoreLevelSetState(checkpoint['iterations'], checkpoint['levelSet'])
+        if len(self.checkpoints) == 0:
+            self.StoreLevelSetState(self.GetShapeMaxIterations(), self.levelSet)
+
+        self.segImg = self.SegToBinary(self.levelSet)
+        
+        return self
+
+    def __init__(self):
+        self.ScalingFactor = []
+        self.AnisotropicIts = []
+        self.AnisotropicTimeStep = []
+        self.AnisotropicConductance = []
+        self.ConfidenceConnectedIts = []
+        self.ConfidenceConnectedMultiplier = []
+        self.ConfidenceConnectedRadius = []
+        self.BinaryMorphologicalRadius = []
+        self.MaxVolume = []
+        self.SeedListFilename = [] 
+        self.SkipTresholdCalculation = False # Flag for running the sigmoid threshold calculation
+        self.DilateImage  = False # Flag for dilating the final segmentation result
+        self.flip_seed_XY = False # Flag for flipping the XY coordinates of the seed location
+        self.flip_sigmoid = False # Flag for segmenting bones which have a higher intensity than background (i.e. lighter)
+        self.show_edgemap = False # Flap to show the edgemap for each bone
+        self.stop_segmentation = False # Flag to stop the segmentation if the user hits the stop button
+
+        # Optional callbacks so the segmentation doesn't depend on the GUI (see SetStopCallback, SetErrorCallback, SetEdgemapCallback)
+        self.stop_callback = None
+        self.error_callback = None
+        self.edgemap_callback = None
+
+        # Cache of the filtered crops and edge maps (set to None to always recompute, see SetPreprocessingCache)
+        self.preprocessing_cache = DefaultPreprocessingCache
+        # Bounds of the preprocessed union of the search windows of all the bones (see PreprocessUnion)
+        self.PreprocessingUnion = None
+        # Anisotropic diffusion of the crops after each number of iterations (see SetDiffusionCache)
+        self.diffusion_cache = DefaultDiffusionCache
+        self.image_key = None
+
+        # Fingerprint and intensity statistics of the input image, if they were computed once for all of the bones
+        # (see SetInputInformation)
+        self.input_fingerprint = None
+        self.input_statistics = None
+
+        # How the edge potential map is computed from the sigmoid image (see SetEdgePotentialMode)
+        self.EdgePotentialMode = 'reference'
+        self.EdgePotentialSigma = 1.0
+
+        # Image region the sigmoid threshold is estimated from (see SetSigmoidEstimation)
+        self.SigmoidEstimation = 'volume'
+
+        # How the LeakageCheck searches for the number of level set iterations (see SetLeakageSearch)
+        self.LeakageSearch = 'random'
+        self.CheckpointIterations = 50 # Iterations between the checkpoints of the CheckpointSearch
+        self.MinCheckpointIterations = 5 # Stop bisecting between checkpoints at this many iterations
+        self.MaxSearchIterations = 3000
+        self.checkpoints = []
+
+        # Peak memory of each stage of Execute (see SetMemoryProfiling)
+        self.profile_memory = False
+        self.memory_profile = MemoryProfile()
+
+        # Multi-resolution (see SetScalingFactor and RefineSegmentation)
+        self.fullResolutionImage = None
+        self.preprocessingScale = [1,1,1]
+        self.RefinementIterations = 20
+        self.RefinementMargin = 3 # Voxels (plus the ScalingFactor) around the up sampled segmentation to refine
+
+        # Level set engine of each bone (BoneLevelSetEngines) or else LevelSetEngine (see SetLevelSetEngine)
+        self.LevelSetEngine = 'shape-detection'
+        self.BoneLevelSetEngines = {}
+
+        # 'levelset' (shape detection level set with the leakage check) or 'region-growing' for a fast
+        # segmentation refined by RegionGrowingIterations of the level set (see SetSegmentationMode)
+        self.SegmentationMode = 'levelset'
+        self.RegionGrowingIterations = 20
+        self.RegionGrowingBand = 2 # Voxels on each side of the region growing boundary refined by the level set
+        self.RegionGrowingRetries = 5 # Region growing retries within the anatomical prior (see RegionGrowingCheck)
+
+        # Initial level set: an ellipsoid of InitialRadius voxels around the seed or the InitialMask (a binary
+        # image in the physical space of the MRI, e.g. a previous result), clipped to NarrowBand mm if not None
+        self.InitialRadius = 3
+        self.NarrowBand = None
+        self.InitialMask = None
+        # 'seed' or 'prior' to start from InitialPriorFraction of the expected size of the bone (see PriorLevelSet)
+        self.InitialShape = 'seed'
+        self.InitialPriorFraction = 0.5
+
+        # Retries of the 'random' leakage search continue from the closest earlier level set (see ResumeLevelSet)
+        self.WarmStart = True
+        self.MaxLevelSetStates = 20
+        self.levelSetStates = []
+
+        # Check the segmentation every EarlyStoppingInterval iterations of the level set and stop once 
+        # one of the observers returns True (0 runs all of the iterations at once, see SetEarlyStopping)
+        self.EarlyStoppingInterval = 0
+        self.level_set_observers = [self.PriorExceeded]
+
+        # Random number generator used by the leakage check (seeded per bone for reproducible results)
+        self.random_state = np.random.RandomState()
+
+        ## Initilize the ITK filters ##
+        # Filters to down/up sample the image for faster computation
+        self.shrinkFilter = sitk.ShrinkImageFilter()
+        self.expandFilter = sitk.ExpandImageFilter()
+
+        # Bias field correction
+        self.BiasFilter = sitk.N4BiasFieldCorrectionImageFilter()
+
+        # Filter to reduce noise while preserving edgdes
+        self.anisotropicFilter = sitk.CurvatureAnisotropicDiffusionImageFilter()
+        # Post-processing filters for fillinging holes and to attempt to remove any leakage areas
+        self.dilateFilter = sitk.BinaryDilateImageFilter()
+        self.erodeFilter = sitk.BinaryErodeImageFilter()
+        self.fillFilter = sitk.BinaryFillholeImageFilter()  
+        self.connectedComponentFilter = sitk.ScalarConnectedComponentImageFilter()
+        self.laplacianFilter = sitk.LaplacianSegmentationLevelSetImageFilter()
+        self.thresholdLevelSet = sitk.ThresholdSegmentationLevelSetImageFilter()
+
+        # Initilize the SimpleITK Filters
+        self.GradientMagnitudeFilter = sitk.GradientMagnitudeImageFilter()
+        self.shapeDetectionFilter = sitk.ShapeDetectionLevelSetImageFilter()
+        self.thresholdFilter = sitk.BinaryThresholdImageFilter()
+        self.sigFilter = sitk.SigmoidImageFilter()
+
+        self.geodesicFilter = sitk.GeodesicActiveContourLevelSetImageFilter()
+
+        # Check the stop button after every level set iteration
+        for levelSetFilter in [self.shapeDetectionFilter, self.geodesicFilter, self.thresholdLevelSet, self.laplacianFilter]:
+            levelSetFilter.AddCommand(sitk.sitkIterationEvent, lambda levelSetFilter=levelSetFilter: self.OnLevelSetIteration(levelSetFilter))
+
+        # Set the deafult values 
+        self.SetDefaultValues()
+
+    def ProcessEvents(self):
+        # Called regularly during the segmentation. Runs the stop callback (if any) which 
+        # can keep a GUI responsive and returns True if the segmentation should stop
+        if self.stop_callback is not None and self.stop_callback() == True:
+            self.stop_segmentation = True
+
+    def SetStopCallback(self, callback):
+        # callback() is called regularly during the segmentation (e.g. to process the GUI events)
+        # Return True from it to stop the segmentation
+        self.stop_callback = callback
+
+    def SetErrorCallback(self, callback):
+        # callback(text, informativeText, detailedText) is called to report an error to the user
+        # before the error is raised
+        self.error_callback = callback
+
+    def SetEdgemapCallback(self, callback):
+        # callback(EdgePotentialMap, boneName) is called with the edge map of each bone when show_edgemap is True
+        self.edgemap_callback = callback
+
+    def ReportError(self, text, informativeText, detailedText):
+        if self.error_callback is not None:
+            self.error_callback(text, informativeText, detailedText)
+
+        raise ValueError(text)
+
+    def SetPreprocessingCache(self, cache):
+        # PreprocessingCache used for the filtered crops and edge maps (None to disable caching)
+        self.preprocessing_cache = cache
+
+    def SetInputInformation(self, fingerprint=None, statistics=None):
+        # Fingerprint (see ImageFingerprint) and intensity statistics (see ImageStatistics) of the image passed to the
+        # following Execute calls, e.g. computed once for all of the bones by the Multiprocessor. None to compute
+        # them in each Execute call
+        self.input_fingerprint = fingerprint
+        self.input_statistics = statistics
+
+    def SetDiffusionCache(self, cache):
+        # DiffusionCache so more diffusion iterations continue from the last result (None to disable)
+        self.diffusion_cache = cache
+
+    def SetEdgePotentialMode(self, mode, sigma=1.0):
+        # 'reference' (the original chain, default), or the faster 'gradient' (edge potential of the gradient magnitude)
+        # or 'recursive-gaussian' (of the gradient magnitude after Gaussian smoothing with sigma mm), see EdgePotentialMap
+        if mode not in EdgePotentialModes:
+            raise ValueError('Unknown edge potential mode ' + str(mode))
+        self.EdgePotentialMode = mode
+        self.EdgePotentialSigma = float(sigma)
+
+    def SetSigmoidEstimation(self, mode):
+        # 'volume' estimates the sigmoid threshold from the intensities of the whole image (computed once per image)
+        # 'roi' estimates it for each bone from the intensities within its search window
+        if mode not in ['volume', 'roi']:
+            raise ValueError('Unknown sigmoid estimation ' + str(mode))
+        self.SigmoidEstimation = mode
+
+    def SetLeakageSearch(self, mode, checkpointIterations=50):
+        # 'random' (the default) re-runs the level set with a random number of iterations until the volume is within the prior
+        # 'checkpoint' evolves the level set once with a snapshot every checkpointIterations (see CheckpointSearch). Each 
+        # step restarts the level set filter from the snapshot, so the results differ from an uninterrupted evolution
+        if mode not in ['checkpoint', 'random']:
+            raise ValueError('Unknown leakage search ' + str(mode))
+        self.LeakageSearch = mode
+        self.CheckpointIterations = int(checkpointIterations)
+
+    def SetMemoryProfiling(self, profile):
+        # Measure the peak memory of each stage of the segmentation (printed with verbose, see GetMemoryProfile)
+        self.profile_memory = profile
+
+    def GetMemoryProfile(self):
+        # List of (stage, peak increase, remaining increase) in bytes of the last segmentation
+        return self.memory_profile.stages
+
+    def MeasureMemory(self, stage):
+        if self.profile_memory == True:
+            self.memory_profile.Stage(stage)
+
+    def ReportMemory(self):
+        if self.profile_memory == True and self.verbose == True:
+            print(' ')
+            print('\033[94m' + 'Memory used by each stage for the ' + str(self.current_bone))
+            print(self.memory_profile.Report())
+
+    def SetLevelSetEngine(self, name, bone=None):
+        # Level set method (see LevelSetEngines) of one bone, or of all the bones without their own engine if bone is None
+        # A refinement engine (e.g. 'laplacian') needs SetSegmentationMode('region-growing') or SetInitialMask first
+        if not self.CanUseLevelSetEngine(name):
+            raise ValueError('The ' + str(name) + " level set engine only refines a close initial segmentation " +
+                "(use SetSegmentationMode('region-growing') or SetInitialMask first)")
+        if bone is None:
+            self.LevelSetEngine = name
+        else:
+            self.BoneLevelSetEngines[bone] = name
+
+    def GetLevelSetEngine(self):
+        name = self.BoneLevelSetEngines.get(self.current_bone, self.LevelSetEngine)
+        if not self.CanUseLevelSetEngine(name):
+            raise ValueError('The ' + str(name) + ' level set engine of the ' + str(self.current_bone) +
+                ' only refines a close initial segmentation (the segmentation mode or initial mask changed)')
+        return GetLevelSetEngine(name)
+
+    def CanUseLevelSetEngine(self, name):
+        # Refinement engines can't grow the segmentation from the seed (see LevelSetEngine.refinementOnly)
+        engine = GetLevelSetEngine(name)
+        return engine.refinementOnly == False or self.SegmentationMode == 'region-growing' or self.InitialMask is not None
+
+    def SetSegmentationMode(self, mode, refinementIterations=20, band=2):
+        # 'levelset' for the full shape detection level set or 'region-growing' for a fast segmentation (e.g. a preview)
+        # by confidence connected region growing and refinementIterations of the level set within band voxels of its
+        # boundary (see RegionGrowing)
+        if mode not in ['levelset', 'region-growing']:
+            raise ValueError('Unknown segmentation mode ' + str(mode))
+        self.SegmentationMode = mode
+        self.RegionGrowingIterations = int(refinementIterations)
+        self.RegionGrowingBand = int(band)
+
+    def SetInitialLevelSet(self, radius=3, narrowBand=None):
+        # Radius (voxels) of the initial ellipsoid around the seed and the narrow band (mm) the
+        # initial signed distance is clipped to (None for the whole crop, see InitializeLevelSet)
+        self.InitialRadius = float(radius)
+        self.NarrowBand = None if narrowBand is None else float(narrowBand)
+
+    def SetInitialShape(self, shape, priorFraction=0.5):
+        # 'seed' starts the level set from the InitialRadius ellipsoid around the seed, 'prior' from an ellipsoid
+        # of priorFraction of the expected bone size within the bone intensities (fewer iterations, see PriorLevelSet)
+        if shape not in ['seed', 'prior']:
+            raise ValueError('Unknown initial shape ' + str(shape))
+        self.InitialShape = shape
+        self.InitialPriorFraction = float(priorFraction)
+
+    def SetInitialMask(self, mask):
+        # Start the level set from a binary SimpleITK image (e.g. a previous result of the same bone) instead
+        # of the seed. The mask is resampled onto the crop, so it only needs to overlap it (None to use the seed)
+        self.InitialMask = mask
+
+    def SetRefinementIterations(self, iterations):
+        # Level set iterations at the full resolution after a down sampled segmentation (see SetScalingFactor)
+        self.RefinementIterations = int(iterations)
+
+    def SetWarmStart(self, warmStart):
+        # Continue the level set retries from the previous result instead of from the seed (see ResumeLevelSet)
+        self.WarmStart = warmStart
+
+    def SetEarlyStopping(self, interval):
+        # Check the segmentation every interval iterations of the level set and stop it as soon as it is
+        # larger than the anatomical prior (0 to disable). Restarting the level set at each check 
+        # slightly changes the evolution, so this is off by default.
+        self.EarlyStoppingInterval = int(interval)
+
+    def SetRandomSeed(self, seed):
+        # Seed the random number generator used in the LeakageCheck and FindNewSeed functions
+        self.random_state = np.random.RandomState(seed)
+
+    def GetOptions(self):
+        # The GUI flags needed to re-create this segmentation class in a worker process
+        # (the SimpleITK filters themselves can't be pickled)
+        # The preprocessing cache is sent without its (in memory) entries, but keeps its disk cache
+        return {'flip_sigmoid':self.flip_sigmoid, 'flip_seed_XY':self.flip_seed_XY,
+            'preprocessing_cache':self.preprocessing_cache, 'PreprocessingUnion':self.PreprocessingUnion, 'LeakageSearch':self.LeakageSearch,
+            'CheckpointIterations':self.CheckpointIterations, 'EarlyStoppingInterval':self.EarlyStoppingInterval,
+            'WarmStart':self.WarmStart, 'ScalingFactor':self.ScalingFactor, 'RefinementIterations':self.RefinementIterations,
+            'profile_memory':self.profile_memory, 'SigmoidEstimation':self.SigmoidEstimation,
+            'EdgePotentialMode':self.EdgePotentialMode, 'EdgePotentialSigma':self.EdgePotentialSigma,
+            'InitialRadius':self.InitialRadius, 'NarrowBand':self.NarrowBand, 'InitialShape':self.InitialShape,
+            'InitialPriorFraction':self.InitialPriorFraction, 'SegmentationMode':self.SegmentationMode,
+            'RegionGrowingIterations':self.RegionGrowingIterations, 'RegionGrowingBand':self.RegionGrowingBand,
+            'RegionGrowingRetries':self.RegionGrowingRetries, 'ConfidenceConnectedIts':self.ConfidenceConnectedIts,
+            'ConfidenceConnectedMultiplier':self.ConfidenceConnectedMultiplier, 'ConfidenceConnectedRadius':self.ConfidenceConnectedRadius,
+            'LevelSetEngine':self.LevelSetEngine, 'BoneLevelSetEngines':self.BoneLevelSetEngines}
+
+    def SetOptions(self, options):
+        for name in options:
+            setattr(self, name, options[name])
+
+    def SetAnatomicalRelaxation(self, newRelaxation):
+        self.AnatomicalRelaxation = newRelaxation
+    def SetCurrentBone(self, newBone):
+        self.current_bone = newBone
+
+    def SetPatientGender(self, newGender):
+        self.PatientGender= newGender
+
+    def SetShapeMaxIterations(self, MaxIts):
+        self.shapeDetectionFilter.SetNumberOfIterations(int(MaxIts))
+
+    def GetShapeMaxIterations(self):
+        MaxIts = self.shapeDetectionFilter.GetNumberOfIterations()
+        return MaxIts
+
+    # def SetSearchWindowSize(self, searchWindow):
+    #     self.searchWindow = [searchWindow, searchWindow, searchWindow]
+
+    def SetShapePropagationScale(self, propagationScale):
+        self.shapeDetectionFilter.SetPropagationScaling(-1*propagationScale)
+
+    def SetShapeCurvatureScale(self, curvatureScale):
+        self.shapeDetectionFilter.SetCurvatureScaling(curvatureScale)
+
+    def SetShapeMaxRMSError(self, MaxRMSError):
+        self.shapeDetectionFilter.SetMaximumRMSError(MaxRMSError)
+
+    def SetLevelSetCurvature(self, curvatureScale):
+        self.thresholdLevelSet.SetCurvatureScaling(curvatureScale)
+        
+    def SetLevelSetPropagation(self, propagationScale):
+        self.thresholdLevelSet.SetPropagationScaling(-1*propagationScale)
+        
+    def SetLevelSetLowerThreshold(self, lowerThreshold):
+        self.sigFilter.SetBeta(int(lowerThreshold))
+        self.thresholdFilter.SetLowerThreshold(int(lowerThreshold)+1) # Add one so the threshold is greater than Zero
+        self.thresholdLevelSet.SetLowerThreshold(int(lowerThreshold))   
+
+
+    def SetLevelSetUpperThreshold(self, upperThreshold):
+        self.sigFilter.SetAlpha(int(upperThreshold))
+        self.thresholdFilter.SetUpperThreshold(int(upperThreshold))
+
+        self.thresholdLevelSet.SetUpperThreshold(int(upperThreshold))   
+        
+    def SetLevelSetError(self,MaxError):        
+        self.thresholdLevelSet.SetMaximumRMSError(MaxError)
+
+    def SetImage(self, image):
+        self.image = image
+
+    def SefSeedPoint(self, SeedPoint):
+        self.SeedPoint = SeedPoint
+
+    def SetScalingFactor(self, ScalingFactor):
+        # Down sample the crop by this factor for the level set, followed by a full resolution refinement (1 to disable)
+        ScalingFactor = [int(ScalingFactor),int(ScalingFactor),int(ScalingFactor)]
+        self.ScalingFactor = ScalingFactor
+        self.shrinkFilter.SetShrinkFactors(ScalingFactor)
+        self.expandFilter.SetExpandFactors(ScalingFactor)
+
+    def SetAnisotropicIts(self, AnisotropicIts):
+        self.anisotropicFilter.SetNumberOfIterations(int(AnisotropicIts))
+    
+    def SetAnisotropicTimeStep(self, AnisotropicTimeStep):
+        self.anisotropicFilter.SetTimeStep(AnisotropicTimeStep)
+    
+    def SetAnisotropicConductance(self, AnisotropicConductance):
+        self.anisotropicFilter.SetConductanceParameter(AnisotropicConductance)
+
+    def SetConfidenceConnectedIts(self, ConfidenceConnectedIts):
+        self.ConfidenceConnectedIts = ConfidenceConnectedIts
+
+    def SetConfidenceConnectedMultiplier(self, ConfidenceConnectedMultiplier):
+        self.ConfidenceConnectedMultiplier = ConfidenceConnectedMultiplier
+
+    def SetConfidenceConnectedRadius(self, ConfidenceConnectedRadius):
+        self.ConfidenceConnectedRadius = ConfidenceConnectedRadius
+
+    def SetBinaryMorphologicalRadius(self, kernelRadius):
+        self.erodeFilter.SetKernelRadius(kernelRadius)
+        self.dilateFilter.SetKernelRadius(kernelRadius) 
+
+    def SetMaxVolume(self, MaxVolume):
+        self.MaxVolume = MaxVolume  
+
+    def SetLaplacianExpansionDirection(self, expansionDirection):       
+        self.laplacianFilter.SetReverseExpansionDirection(expansionDirection)
+
+    def SetLaplacianError(self, RMSError):
+        self.laplacianFilter.SetMaximumRMSError(RMSError)
+
+    def SetConnectedComponentFullyConnected(self, fullyConnected):
+        self.connectedComponentFilter.SetFullyConnected(fullyConnected) 
+
+    def SetConnectedComponentDistance(self, distanceThreshold):
+        #Distance = Intensity difference NOT location distance
+        self.connectedComponentFilter.SetDistanceThreshold(distanceThreshold) 
+   
+    def EstimateSigmoid(self):
+        ''' Estimate the upper threshold of the sigmoid based on the 
+        mean and std of the image intensities '''
+        if self.SigmoidEstimation == 'roi':
+            # Only the search window around the seed point (see CropImage)
+            statistics = ArrayStatistics(self.GetSearchWindowArray())
+        elif self.input_statistics is not None:
+            statistics = self.input_statistics # Computed once for all of the bones (see SetInputInformation)
+        elif self.shared_volume is not None:
+            statistics = ImageStatistics(self.shared_volume)
+        else:
+            statistics = ImageStatistics(self.image)
+
+        # [ndaImg > 25]
+        std = statistics.std # 30 25
+        mean = statistics.mean
+
+        # Using a linear model (fitted in Matlab and manually selected sigmoid threshold values)
+        # UpperThreshold = 0.899*(std+mean) - 41.3
+
+        UpperThreshold = 0.002575*(std+mean)*(std+mean) - 0.028942*(std+mean) + 36.791614
+
+        if self.verbose == True:
+            print('Mean: ' + str(round(mean,2)))
+            print('STD: ' + str(round(std,2)))
+            print('UpperThreshold: ' + str(round(UpperThreshold,2)))
+            print(' ')
+
+        return UpperThreshold
+
+    def GetSearchWindowArray(self):
+        # Numpy view (z,y,x) of the image within the search window around the seed point (no copy)
+        if self.shared_volume is not None:
+            ndaImg = self.shared_volume.GetArray()
+        else:
+            ndaImg = sitk.GetArrayViewFromImage(self.image)
+
+        lower, upper = self.GetCropBounds()
+
+        return ndaImg[lower[2]:upper[2], lower[1]:upper[1], lower[0]:upper[0]]
+
+    def FlipImage(self,image):
+        #Flip image(s) (if needed)
+        flipFilter = sitk.FlipImageFilter()
+        flipFilter.SetFlipAxes((False,True,False))
+        image = flipFilter.Execute(self.image)
+        return image
+
+    def ThresholdImage(self):
+        try:
+            self.segImg.CopyInformation(self.image)
+        except:
+            print('Error in copying information from self.image')
+        tempImg = self.segImg * self.image
+        self.segImg = self.thresholdFilter.Execute(tempImg)
+        return self
+    
+    def scaleDownImage(self):
+        self.image = self.shrinkFilter.Execute(self.image)
+        return self
+
+    def scaleUpImage(self):
+        self.segImg = self.expandFilter.Execute(self.segImg)
+        return self
+
+    def GetDiffusionKey(self, lowerIndex=None, upperIndex=None):
+        # Everything besides the number of iterations which changes the diffusion of the crop (see DiffusionCache)
+        if lowerIndex is None:
+            lowerIndex, upperIndex = self.cropLowerIndex, self.cropUpperIndex
+
+        if self.image_key is None:
+            self.image_key = ImageFingerprint(self.original_input)
+
+        return (self.image_key, tuple(lowerIndex), tuple(upperIndex), tuple(self.preprocessingScale),
+            self.anisotropicFilter.GetTimeStep(), self.anisotropicFilter.GetConductanceParameter())
+
+    # Function definitions are below
+    def apply_AnisotropicFilter(self, lowerIndex=None, upperIndex=None):
+        ' Anisotropic diffusion of the crop (from lowerIndex to upperIndex in the image, by default the crop from CropImage) '
+        iterations = self.anisotropicFilter.GetNumberOfIterations()
+
+        # Continue from the diffusion with the most iterations done so far
+        # (a cache fault only costs the time of filtering from the start)
+        done = 0
+        key = None
+        if self.diffusion_cache is not None:
+            try:
+                key = self.GetDiffusionKey(lowerIndex, upperIndex)
+                done, cached = self.diffusion_cache.Lookup(key, iterations)
+            except (RuntimeError, KeyError, ValueError, MemoryError) as e:
+                if self.verbose == True:
+                    print('Diffusion cache lookup failed (' + str(e) + '), filtering the crop from the start')
+                key = None
+                done, cached = 0, None
+
+            if cached is not None:
+                self.image = cached
+                if self.verbose == True:
+                    print('Continuing the anisotropic diffusion from ' + str(done) + ' iterations')
+
+        if done == iterations and done > 0:
+            return self
+
+        try:
+            self.anisotropicFilter.SetNumberOfIterations(iterations - done)
+            self.image = self.anisotropicFilter.Execute(self.image)
+            self.anisotropicFilter.SetNumberOfIterations(iterations)
+        except:
+            self.anisotropicFilter.SetNumberOfIterations(iterations)
+
+            # An error is generated here if the seed location is outside of the field of view
+            # This is likely due to the image not being in the RAS orientation
+            # Simple fix is to use the "Flip Seed XY" checkmark
+            # Other fix is to click on the "Ignore Orientation" advanced option when loading the image into 3D Slicer.
+
+            # Raise an error and provide a suggested solution
+            self.ReportError("The requested region is outside the largest possible region! This is likely due to an issue with the seed locations.",
+            "Click on Show Details for a suggested fix.",
+            "There are two likely causes for this error. \n \nFirst check that the seed location is within the image field of view)."+
+            " \n \nThe second likely cause is the image in not in the RAS orientation. A simple fix is to use the 'Flip Seed XY' checkmark (below the Stop button)."+
+            "\n \nThis will flip the x and y coordinates to align correctly. Check the checkmark and try it again."+
+            "\n\nAlternatively, another fix is to click on the 'Ignore Orientation' advanced option when loading the image into 3D Slicer.")
+
+            return self
+
+        if key is not None:
+            try:
+                self.diffusion_cache.Store(key, iterations, self.image)
+            except (RuntimeError, KeyError, ValueError, MemoryError) as e:
+                if self.verbose == True:
+                    print('Diffusion cache store failed (' + str(e) + ')')
+
+        return self
+
+    def savePointList(self):
+        try:
+            # Save the user defined points in a .txt for automatimating testing (TODO)
+            text_file = open(self.SeedListFilename, "r+")
+            text_file.readlines()
+            text_file.write("%s\n" % self.seedPoint)
+            text_file.close()
+        except:
+            print("Saving to .txt failed...")
+        return
+
+    def AddImages(self, imageOne, imageTwo, iteration_num):
+
+        # Add iteration_num to imageOne wherever imageTwo is non-zero
+        imageTwo = sitk.BinaryThreshold(imageTwo, 0, 0, 0, 1)
+        output = imageOne + sitk.Cast(imageTwo, imageOne.GetPixelID())*iteration_num
+
+        return output
+
+    def SegToBinary(self, image):
+        # Want 0 for the background and 1 for the objects (the positive values of the level set)
+        return sitk.Greater(image, 0) # 8-bit image with the same information as the level set
+
+
+    def BiasFieldCorrection(self): 
+        if self.verbose == True:
+            print('\033[94m' + 'Bias Field Correction')
+
+        #   Correct for the MRI bias field 
+        self.image  = sitk.Cast(self.image, sitk.sitkFloat32)
+
+        # test = sitk.OtsuThreshold( self.image, 0, 1, 200 )
+
+        mask_img = sitk.Image(self.image.GetSize(), sitk.sitkUInt8) #Can't be a 32 bit float
+        mask_img.CopyInformation(self.image)
+
+
+        self.image = self.BiasFilter.Execute(self.image, mask_img)
@@ -0,0 +1,153 @@
+#############################################################################################
+###COMMAND LINE BATCH MODE###
+#############################################################################################
+
+import SimpleITK as sitk
+
+import timeit
+
+from WRISTLib.AnatomicPriors import BoneList
+from WRISTLib.ParallelSegmentation import Multiprocessor
+from WRISTLib.PreprocessingCache import DiskPreprocessingCache
+
+
+def ReadSeedFile(filename, ras=False):
+    """ Read the bone names and seed locations (physical coordinates) from a text file.
+        Either a 3D Slicer markups file (.fcsv) where the label of each fiducial is the bone name
+        or a comma seperated file with one 'BoneName, x, y, z' line per bone.
+        Markups files are read as RAS unless their header says LPS (ras only applies to the text files).
+        Returns the bone names and the seed points in the LPS coordinates used by SimpleITK """
+    bones = []
+    seedPoints = []
+    fcsv = filename.lower().endswith('.fcsv')
+    if fcsv:
+        ras = True # Slicer's default when the header doesn't list the coordinate system
+
+    with open(filename, 'r') as seedFile:
+        for line in seedFile:
+            line = line.strip()
+
+            if line.startswith('#'):
+                # Slicer markups files list the coordinate system in the header (RAS unless stated otherwise)
+                if fcsv and 'CoordinateSystem' in line:
+                    ras = not ('LPS' in line or line.endswith('1'))
+                continue
+            if line == '':
+                continue
+
+            columns = [column.strip() for column in line.split(',')]
+            if fcsv:
+                # id,x,y,z,ow,ox,oy,oz,vis,sel,lock,label,desc,associatedNodeID
+                name = columns[11]
+                point = [float(columns[1]), float(columns[2]), float(columns[3])]
+            else:
+                name = columns[0]
+                point = [float(columns[1]), float(columns[2]), float(columns[3])]
+
+            # Match the bone names regardless of capitalization
+            matches = [bone for bone in BoneList if bone.lower() == name.lower()]
+            if matches == []:
+                raise ValueError('Unknown bone name "' + name + '" in ' + filename + '. Must be one of ' + ', '.join(BoneList))
+
+            if ras == True:
+                # Slicer uses RAS coordinates while SimpleITK uses LPS so flip the X and Y
+                point = [-1*point[0], -1*point[1], point[2]]
+
+            bones.append(matches[0])
+            seedPoints.append(point)
+
+    if bones == []:
+        raise ValueError('No seed points found in ' + filename)
+
+    return bones, seedPoints
+
+def main(argv=None):
+    # Run the segmentation without 3D Slicer (e.g. on a headless compute server)
+    # The default parameter values are the same as the default values in the GUI
+    import argparse
+
+    parser = argparse.ArgumentParser(description='WRIST - Carpal bone segmentation from MRI (command line batch mode)')
+    parser.add_argument('image', help='Input MRI (any format SimpleITK can read, e.g. .nrrd, .nii.gz, .mha)')
+    parser.add_argument('seeds', help='Seed file: a Slicer markups .fcsv labeled with the bone names or a text file with one "BoneName, x, y, z" line per bone')
+    parser.add_argument('output', help='Output label map file (e.g. .nrrd, .nii.gz, .mha)')
+    parser.add_argument('--gender', default='Unknown', choices=['Male', 'Female', 'Unknown'], help='Gender of the subject (for the prior shape information)')
+    parser.add_argument('--ras', action='store_true', help='The seed coordinates of a text seed file are in RAS (as in Slicer) instead of LPS')
+    parser.add_argument('--relaxation', type=float, default=0, help='Anatomical relaxation (1 skips the convergence checks)')
+    parser.add_argument('--max-iterations', type=float, default=500, help='Initial maximum iterations of the shape detection level set')
+    parser.add_argument('--max-rms-error', type=float, default=0.003, help='Maximum RMS error of the shape detection level set')
+    parser.add_argument('--curvature-scale', type=float, default=1, help='Curvature scale of the shape detection level set')
+    parser.add_argument('--propagation-scale', type=float, default=2, help='Propagation scale of the shape detection level set')
+    parser.add_argument('--diffusion-iterations', type=float, default=5, help='Anisotropic diffusion iterations')
+    parser.add_argument('--sigmoid-threshold', type=float, default=0, help='Sigmoid threshold (0 to estimate it from the image)')
+    parser.add_argument('--sigmoid-estimation', default='volume', choices=['volume', 'roi'], help='Estimate the sigmoid threshold from the whole image or from the search window around each seed')
+    parser.add_argument('--edge-potential', default='reference', choices=['reference', 'gradient', 'recursive-gaussian'], help='How the edge potential map is computed: the original 16-bit gradient vector chain (default), or the faster but slightly different gradient magnitude of the sigmoid image, or the same after Gaussian smoothing (--edge-sigma)')
+    parser.add_argument('--edge-sigma', type=float, default=1.0, help='Standard deviation (mm) of the Gaussian smoothing with --edge-potential recursive-gaussian')
+    parser.add_argument('--no-dilate', action='store_true', help='Do not dilate the final segmentation')
+    parser.add_argument('--flip-sigmoid', action='store_true', help='The bones are brighter than the background (experimental)')
+    parser.add_argument('--mode', default='levelset', choices=['levelset', 'region-growing'], help='Segment with the shape detection level set, or quickly by confidence connected region growing refined by --region-growing-iterations of the level set (e.g. for a preview)')
+    parser.add_argument('--region-growing-iterations', type=int, default=20, help='Level set iterations refining the boundary with --mode region-growing (0 to skip)')
+    parser.add_argument('--region-growing-band', type=int, default=2, help='Voxels on each side of the region growing boundary the level set refines with --mode region-growing')
+    parser.add_argument('--level-set-engine', default='shape-detection', choices=['shape-detection', 'geodesic', 'threshold'], help='Level set method of all the bones')
+    parser.add_argument('--bone-engine', action='append', default=[], metavar='BONE=ENGINE', help='Level set method of one bone (e.g. --bone-engine Pisiform=geodesic), can be repeated. The laplacian engine only refines the boundary with --mode region-growing')
+    parser.add_argument('--leakage-search', default='random', choices=['random', 'checkpoint'], help='Search for the level set iterations within the anatomical prior by re-running with random iterations (the original method), or by evolving once with checkpoints (faster, but the results differ)')
+    parser.add_argument('--no-warm-start', action='store_true', help='Re-run each retry of the random leakage search from the seed instead of continuing from the previous level set')
+    parser.add_argument('--multi-resolution', type=int, default=1, help='Down sample the image by this factor for the level set and refine the result at the full resolution (1 to disable)')
+    parser.add_argument('--refinement-iterations', type=int, default=20, help='Level set iterations at the full resolution with --multi-resolution')
+    parser.add_argument('--early-stopping', type=int, default=0, help='Check the segmentation every N level set iterations and stop once it is larger than the anatomical prior (0 to disable)')
+    parser.add_argument('--initial-radius', type=float, default=3, help='Radius (voxels) of the initial level set around each seed')
+    parser.add_argument('--initial-shape', default='seed', choices=['seed', 'prior'], help='Start the level set from a small sphere around the seed or from an ellipsoid sized from the expected bone dimensions (--prior-fraction) within the bone intensities')
+    parser.add_argument('--prior-fraction', type=float, default=0.5, help='Fraction of the expected bone size of the initial ellipsoid with --initial-shape prior')
+    parser.add_argument('--narrow-band', type=float, default=None, help='Clip the initial signed distance to this many mm around the initial surface (default: the whole crop)')
+    parser.add_argument('--profile-memory', action='store_true', help='Print the peak memory used by each stage of the segmentation of each bone')
+    parser.add_argument('--shared-preprocessing', action='store_true', help='Filter the union of the search windows of all the bones once instead of the (overlapping) window of each bone (faster, but the results differ slightly)')
+    parser.add_argument('--cpus', type=int, default=1, help='Number of CPUs (one bone per process)')
+    parser.add_argument('--cache-dir', default=None, help='Folder to keep the preprocessed images in between runs (e.g. when segmenting the same image again)')
+    parser.add_argument('--cache-size', type=float, default=4, help='Maximum size of the cache folder in GB')
+    parser.add_argument('--cache-compress', action='store_true', help='Compress the images in the cache folder. Compressed images are not memory mapped: the slices around each search window are decompressed instead')
+    parser.add_argument('--random-seed', type=int, default=0, help='Seed for the random numbers of the convergence checks')
+    args = parser.parse_args(argv)
+
+    image = sitk.ReadImage(args.image)
+    BonesSelected, seedPoints = ReadSeedFile(args.seeds, args.ras)
+
+    print('Segmenting ' + ', '.join(BonesSelected) + ' in ' + args.image)
+
+    parameters = [args.curvature_scale, args.max_rms_error, args.max_iterations, 
+                    args.propagation_scale, args.gender, BonesSelected, args.relaxation,
+                    args.diffusion_iterations, not args.no_dilate, args.sigmoid_threshold] 
+
+    multiHelper = Multiprocessor()
+    multiHelper.randomSeed = args.random_seed
+    multiHelper.SetSharedPreprocessing(args.shared_preprocessing)
+    multiHelper.segmentationClass.flip_sigmoid = args.flip_sigmoid
+    multiHelper.segmentationClass.SetSegmentationMode(args.mode, args.region_growing_iterations, args.region_growing_band)
+    multiHelper.segmentationClass.SetLevelSetEngine(args.level_set_engine)
+    for boneEngine in args.bone_engine:
+        bone, engine = boneEngine.split('=')
+        multiHelper.segmentationClass.SetLevelSetEngine(engine.strip(), bone.strip())
+    multiHelper.segmentationClass.SetLeakageSearch(args.leakage_search)
+    multiHelper.segmentationClass.SetSigmoidEstimation(args.sigmoid_estimation)
+    multiHelper.segmentationClass.SetEdgePotentialMode(args.edge_potential, args.edge_sigma)
+    multiHelper.segmentationClass.SetEarlyStopping(args.early_stopping)
+    multiHelper.segmentationClass.SetWarmStart(not args.no_warm_start)
+    multiHelper.segmentationClass.SetScalingFactor(args.multi_resolution)
+    multiHelper.segmentationClass.SetRefinementIterations(args.refinement_iterations)
+    multiHelper.segmentationClass.SetInitialLevelSet(args.initial_radius, args.narrow_band)
+    multiHelper.segmentationClass.SetInitialShape(args.initial_shape, args.prior_fraction)
+    multiHelper.segmentationClass.SetMemoryProfiling(args.profile_memory)
+    if args.cache_dir is not None:
+        multiHelper.segmentationClass.preprocessing_cache.SetDiskCache(
+            DiskPreprocessingCache(args.cache_dir, int(args.cache_size*1024*1024*1024), args.cache_compress))
+
+    start_time = timeit.default_timer()
+    Segmentation = multiHelper.Execute(seedPoints, image, parameters, args.cpus, None, True)
+    elapsed = timeit.default_timer() - start_time
+
+    sitk.WriteImage(sitk.Cast(Segmentation, sitk.sitkUInt8), args.output)
+
+    for result in multiHelper.results:
+        print(result.bone + ': ' + str(round(result.GetVolume())) + ' mm^3')
+
+    print('Saved the segmentation to ' + args.output + ' (' + str(round(elapsed,1)) + ' seconds)')
+
+    return 0
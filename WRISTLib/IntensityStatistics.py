@@ -0,0 +1,76 @@
+#############################################################################################
+###INTENSITY STATISTICS OF THE MRI (FOR THE SIGMOID THRESHOLD ESTIMATION)###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+
+class IntensityStatistics(object):
+    """Mean, standard deviation, minimum and maximum of the voxel intensities, along with the
+    histogram (one bin per intensity value) for images of up to 16-bit integers."""
+    def __init__(self, count, mean, std, minimum, maximum, histogram=None, offset=0):
+        self.count = count
+        self.mean = mean
+        self.std = std
+        self.min = minimum
+        self.max = maximum
+        self.histogram = histogram # Number of voxels with each intensity (the first bin is the intensity offset)
+        self.offset = offset
+
+
+def ArrayStatistics(nda, sliceCount=16):
+    ' Intensity statistics of a (z,y,x) numpy array in a single pass over blocks of sliceCount slices '
+    if nda.size == 0:
+        return IntensityStatistics(0, 0.0, 0.0, 0, 0)
+
+    if np.issubdtype(nda.dtype, np.integer) and nda.dtype.itemsize <= 2:
+        # Count each intensity value, the mean and standard deviation follow exactly from the histogram
+        offset = int(np.iinfo(nda.dtype).min)
+        histogram = np.zeros(int(np.iinfo(nda.dtype).max) - offset + 1, dtype=np.int64)
+        for z in range(0, nda.shape[0], sliceCount):
+            block = np.asarray(nda[z:z+sliceCount]).ravel()
+            if offset != 0:
+                block = block.astype(np.int64) - offset
+            histogram[:int(block.max())+1] += np.bincount(block)
+
+        nonzero = np.flatnonzero(histogram)
+        histogram = histogram[:nonzero[-1]+1]
+        values = np.arange(len(histogram), dtype=np.float64) + offset
+
+        count = int(histogram.sum())
+        mean = float(np.dot(histogram, values))/count
+        std = float(np.sqrt(np.dot(histogram, (values - mean)**2)/count))
+
+        return IntensityStatistics(count, mean, std, int(nonzero[0]) + offset, int(nonzero[-1]) + offset, histogram, offset)
+
+    # Otherwise combine the mean and the sum of squared differences of each block (Chan et al.)
+    count = 0
+    mean = 0.0
+    squares = 0.0
+    minimum = np.inf
+    maximum = -np.inf
+    for z in range(0, nda.shape[0], sliceCount):
+        block = np.asarray(nda[z:z+sliceCount], dtype=np.float64).ravel()
+        blockMean = block.mean()
+        blockSquares = ((block - blockMean)**2).sum()
+
+        delta = blockMean - mean
+        total = count + block.size
+        squares = squares + blockSquares + delta*delta*count*block.size/total
+        mean = mean + delta*block.size/total
+        count = total
+
+        minimum = min(minimum, block.min())
+        maximum = max(maximum, block.max())
+
+    return IntensityStatistics(count, mean, float(np.sqrt(squares/count)), minimum, maximum)
+
+
+def ImageStatistics(image):
+    ''' Intensity statistics of a SimpleITK image (or SharedVolume). Goes through the whole image, so compute
+    it once per run and pass it on (see BoneSeg.SetInputInformation) '''
+    if hasattr(image, 'GetStatistics'):
+        return image.GetStatistics() # SharedVolume (computed once before it is sent to the workers)
+
+    return ArrayStatistics(sitk.GetArrayViewFromImage(image))
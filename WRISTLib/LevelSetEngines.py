@@ -0,0 +1,210 @@
+#############################################################################################
+###LEVEL SET ENGINES (SELECTABLE FOR EACH BONE, SEE BoneSeg.SetLevelSetEngine)###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+import json
+import timeit
+
+
+class LevelSetEngine(object):
+    """A level set method of BoneSeg. Execute(segmentationClass, initialLevelSet, iterations) evolves the
+    initial level set (positive inside) for up to iterations and returns (levelSet, elapsed iterations).
+    The speed and accuracy measured for each bone and protocol are kept in characteristics
+    (see RecordEngineCharacteristics and SelectLevelSetEngine). An engine with refinementOnly can't grow a
+    segmentation from the seed and is only used after a close initialization (see BoneSeg.CanUseLevelSetEngine)."""
+    refinementOnly = False
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.characteristics = {} # (bone, protocol): list of {'seconds', 'dice'} measurements
+
+    def GetFilter(self, segmentationClass):
+        raise NotImplementedError
+
+    def GetFeatureImage(self, segmentationClass):
+        # The edge potential map of the crop (see BoneSeg.PreprocessLevelSet)
+        return segmentationClass.EdgePotentialMap
+
+    def Configure(self, segmentationClass, levelSetFilter):
+        pass
+
+    def Execute(self, segmentationClass, initialLevelSet, iterations):
+        levelSetFilter = self.GetFilter(segmentationClass)
+        self.Configure(segmentationClass, levelSetFilter)
+
+        MaxIts = levelSetFilter.GetNumberOfIterations()
+        levelSetFilter.SetNumberOfIterations(int(iterations))
+        try:
+            levelSet = levelSetFilter.Execute(initialLevelSet, self.GetFeatureImage(segmentationClass))
+        finally:
+            levelSetFilter.SetNumberOfIterations(MaxIts)
+
+        return levelSet, levelSetFilter.GetElapsedIterations()
+
+
+class ShapeDetectionEngine(LevelSetEngine):
+    # The original method: shape detection level set on the edge potential map
+    def GetFilter(self, segmentationClass):
+        return segmentationClass.shapeDetectionFilter
+
+
+class GeodesicActiveContourEngine(LevelSetEngine):
+    # Shape detection plus an advection term pulling the front onto the edges (same scaling as the shape detection)
+    def GetFilter(self, segmentationClass):
+        return segmentationClass.geodesicFilter
+
+    def Configure(self, segmentationClass, levelSetFilter):
+        shapeDetectionFilter = segmentationClass.shapeDetectionFilter
+        levelSetFilter.SetPropagationScaling(shapeDetectionFilter.GetPropagationScaling())
+        levelSetFilter.SetCurvatureScaling(shapeDetectionFilter.GetCurvatureScaling())
+        levelSetFilter.SetMaximumRMSError(shapeDetectionFilter.GetMaximumRMSError())
+
+
+class ThresholdEngine(LevelSetEngine):
+    # Grows within the intensities on the bone side of the sigmoid threshold of the filtered crop (no edge map)
+    def GetFilter(self, segmentationClass):
+        return segmentationClass.thresholdLevelSet
+
+    def GetFeatureImage(self, segmentationClass):
+        return segmentationClass.image
+
+    def Configure(self, segmentationClass, levelSetFilter):
+        image = segmentationClass.image
+        minMaxFilter = sitk.MinimumMaximumImageFilter()
+        minMaxFilter.Execute(image)
+
+        threshold = float(segmentationClass.sigFilter.GetBeta())
+        seedPoint = np.clip(np.asarray(segmentationClass.seedPoint[0]).astype(int), 0, np.asarray(image.GetSize()) - 1)
+        if image.GetPixel(seedPoint.tolist()) <= threshold:
+            levelSetFilter.SetLowerThreshold(minMaxFilter.GetMinimum())
+            levelSetFilter.SetUpperThreshold(threshold)
+        else:
+            levelSetFilter.SetLowerThreshold(threshold)
+            levelSetFilter.SetUpperThreshold(minMaxFilter.GetMaximum())
+
+
+class LaplacianEngine(LevelSetEngine):
+    # Moves the front onto the zero crossings of the Laplacian of the filtered crop. Only refines a boundary
+    # which is already close (e.g. with SetSegmentationMode('region-growing') or SetInitialMask)
+    refinementOnly = True
+
+    def GetFilter(self, segmentationClass):
+        return segmentationClass.laplacianFilter
+
+    def GetFeatureImage(self, segmentationClass):
+        return segmentationClass.image
+
+
+LevelSetEngines = {}
+
+def RegisterLevelSetEngine(engine):
+    # Add (or replace) an engine selectable by its name with BoneSeg.SetLevelSetEngine
+    LevelSetEngines[engine.name] = engine
+    return engine
+
+RegisterLevelSetEngine(ShapeDetectionEngine('shape-detection', 'Shape detection level set on the edge potential map'))
+RegisterLevelSetEngine(GeodesicActiveContourEngine('geodesic', 'Geodesic active contour on the edge potential map'))
+RegisterLevelSetEngine(ThresholdEngine('threshold', 'Threshold level set on the bone intensities of the filtered image'))
+RegisterLevelSetEngine(LaplacianEngine('laplacian', 'Laplacian level set refinement of a close initial segmentation'))
+
+
+def GetLevelSetEngine(name):
+    if name not in LevelSetEngines:
+        raise ValueError('Unknown level set engine ' + str(name))
+    return LevelSetEngines[name]
+
+
+def RecordEngineCharacteristics(name, bone, protocol, seconds, dice):
+    # Keep a measurement of the time (seconds) and accuracy (Dice with a reference segmentation) of an engine
+    characteristics = GetLevelSetEngine(name).characteristics
+    characteristics.setdefault((bone, protocol), []).append({'seconds':float(seconds), 'dice':float(dice)})
+
+
+def GetEngineCharacteristics(name, bone, protocol):
+    ' Mean time (seconds) and Dice of the measurements of an engine, None if it was never measured '
+    measurements = GetLevelSetEngine(name).characteristics.get((bone, protocol), [])
+    if len(measurements) == 0:
+        return None
+
+    return {'seconds':float(np.mean([m['seconds'] for m in measurements])),
+        'dice':float(np.mean([m['dice'] for m in measurements])), 'count':len(measurements)}
+
+
+def SelectLevelSetEngine(bone, protocol, minDice, default='shape-detection'):
+    ' The fastest engine with a mean Dice of at least minDice for the bone and protocol (default if none were measured) '
+    best = None
+    bestSeconds = np.inf
+    for name in LevelSetEngines:
+        characteristics = GetEngineCharacteristics(name, bone, protocol)
+        if characteristics is not None and characteristics['dice'] >= minDice and characteristics['seconds'] < bestSeconds:
+            best = name
+            bestSeconds = characteristics['seconds']
+
+    return default if best is None else best
+
+
+def SaveEngineCharacteristics(filename):
+    # Write the measurements of all the engines to a json file (see LoadEngineCharacteristics)
+    data = {}
+    for name in LevelSetEngines:
+        data[name] = [{'bone':bone, 'protocol':protocol, 'measurements':measurements}
+            for (bone, protocol), measurements in LevelSetEngines[name].characteristics.items()]
+
+    with open(filename, 'w') as characteristicsFile:
+        json.dump(data, characteristicsFile, indent=1)
+
+
+def LoadEngineCharacteristics(filename):
+    # Add the measurements of a json file written by SaveEngineCharacteristics (unknown engines are skipped)
+    with open(filename) as characteristicsFile:
+        data = json.load(characteristicsFile)
+
+    for name in data:
+        if name not in LevelSetEngines:
+            continue
+        for entry in data[name]:
+            for measurement in entry['measurements']:
+                RecordEngineCharacteristics(name, entry['bone'], entry['protocol'], measurement['seconds'], measurement['dice'])
+
+
+def BenchmarkLevelSetEngines(segmentationClass, image, seedPoint, reference, protocol='default', names=None, verbose=False):
+    ''' Segment the current bone of the segmentation class (BoneSeg) with each engine, measure the time and the
+    Dice with the reference segmentation (an image with the information of image), and record them.
+    seedPoint is given as for BoneSeg.Execute ([[x, y, z]] physical). Returns {name: {'seconds', 'dice'}} '''
+    if names is None:
+        names = [name for name in LevelSetEngines if segmentationClass.CanUseLevelSetEngine(name)]
+
+    bone = segmentationClass.current_bone
+    previous = segmentationClass.BoneLevelSetEngines.get(bone)
+    reference = sitk.Greater(reference, 0)
+
+    results = {}
+    try:
+        for name in names:
+            segmentationClass.SetLevelSetEngine(name, bone)
+
+            start_time = timeit.default_timer()
+            segmentation = segmentationClass.Execute(image, seedPoint, verbose=verbose)
+            seconds = timeit.default_timer() - start_time
+            if segmentation is None:
+                break # Stopped
+
+            segmentation = sitk.Greater(segmentation, 0)
+            segmentation.CopyInformation(reference)
+            overlapFilter = sitk.LabelOverlapMeasuresImageFilter()
+            overlapFilter.Execute(segmentation, reference)
+            dice = overlapFilter.GetDiceCoefficient()
+
+            RecordEngineCharacteristics(name, bone, protocol, seconds, dice)
+            results[name] = {'seconds':seconds, 'dice':dice}
+    finally:
+        if previous is None:
+            segmentationClass.BoneLevelSetEngines.pop(bone, None)
+        else:
+            segmentationClass.BoneLevelSetEngines[bone] = previous
+
+    return results
@@ -0,0 +1,46 @@
+#############################################################################################
+###INITIAL LEVEL SETS (SIGNED DISTANCE, POSITIVE INSIDE)###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+
+def EllipsoidLevelSet(image, center, radii, narrowBand=None):
+    ''' Initial level set (float 32, with the information of image) of an ellipsoid around the voxel index
+    center with radii in mm along the x, y, and z axes of the image. Computed directly from the voxel
+    coordinates: the value is the distance (mm) to the surface along the line to the center, which is the
+    signed distance for a sphere. Clipped to [-narrowBand, narrowBand] mm if given '''
+    size = image.GetSize()
+    spacing = np.asarray(image.GetSpacing(), dtype=np.float32)
+    radii = np.maximum(np.asarray(radii, dtype=np.float32), 1e-3)
+
+    # Distance (mm) from the center along each axis, indexed z,y,x so they broadcast to the whole image
+    dx = ((np.arange(size[0], dtype=np.float32) - center[0])*spacing[0])[np.newaxis, np.newaxis, :]
+    dy = ((np.arange(size[1], dtype=np.float32) - center[1])*spacing[1])[np.newaxis, :, np.newaxis]
+    dz = ((np.arange(size[2], dtype=np.float32) - center[2])*spacing[2])[:, np.newaxis, np.newaxis]
+
+    distance = np.sqrt(dx*dx + dy*dy + dz*dz)
+    scaled = np.sqrt((dx/radii[0])**2 + (dy/radii[1])**2 + (dz/radii[2])**2) # 1 on the surface
+
+    # Distance from the center to the surface along the line through each voxel (the smallest radius at the center)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        levelSet = np.where(scaled > 0, distance/scaled, radii.min()) - distance
+
+    if narrowBand is not None:
+        np.clip(levelSet, -narrowBand, narrowBand, out=levelSet)
+
+    levelSet = sitk.GetImageFromArray(levelSet.astype(np.float32, copy=False))
+    levelSet.CopyInformation(image)
+
+    return levelSet
+
+
+def MaskLevelSet(mask, narrowBand=None):
+    ' Initial level set (float 32) of a binary mask (e.g. a previous segmentation), clipped to [-narrowBand, narrowBand] mm if given '
+    levelSet = sitk.SignedMaurerDistanceMap(sitk.Greater(mask, 0), insideIsPositive=True, useImageSpacing=True)
+
+    if narrowBand is not None:
+        levelSet = sitk.Clamp(levelSet, sitk.sitkFloat32, -narrowBand, narrowBand)
+
+    return sitk.Cast(levelSet, sitk.sitkFloat32)
@@ -0,0 +1,66 @@
+#############################################################################################
+###MEMORY PROFILE OF THE SEGMENTATION STAGES###
+#############################################################################################
+
+
+def ReadMemoryStatus():
+    # Current and peak resident memory of this process in bytes (Linux only, otherwise None)
+    try:
+        with open('/proc/self/status') as statusFile:
+            status = statusFile.read().split('\n')
+    except IOError:
+        return None, None
+
+    current = peak = None
+    for line in status:
+        if line.startswith('VmRSS:'):
+            current = int(line.split()[1])*1024
+        elif line.startswith('VmHWM:'):
+            peak = int(line.split()[1])*1024
+
+    return current, peak
+
+
+def ResetPeakMemory():
+    # Reset the peak resident memory (VmHWM) of this process (Linux 4.0 or newer). Returns False if not possible
+    try:
+        with open('/proc/self/clear_refs', 'w') as clearFile:
+            clearFile.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class MemoryProfile(object):
+    """Peak memory used by each stage of a segmentation (e.g. BoneSeg.Execute). Call Start() before the
+    first stage and Stage(name) at the end of each stage. The peak is measured by resetting the peak
+    resident memory of the process at the start of each stage, so it includes the SimpleITK images
+    (which Python's own memory tracing doesn't see). Only available on Linux."""
+    def __init__(self):
+        self.stages = [] # (name, peak increase, remaining increase) in bytes
+        self.start = None
+        self.resetPeak = False
+
+    def Start(self):
+        self.stages = []
+        self.resetPeak = ResetPeakMemory()
+        self.start, peak = ReadMemoryStatus()
+
+    def Stage(self, name):
+        if self.start is None:
+            return
+        current, peak = ReadMemoryStatus()
+        if self.resetPeak == False:
+            peak = current # The peak can't be reset so only the change in memory is known
+
+        self.stages.append((name, peak - self.start, current - self.start))
+
+        self.resetPeak = ResetPeakMemory()
+        self.start, peak = ReadMemoryStatus()
+
+    def Report(self):
+        lines = []
+        for name, peak, remaining in self.stages:
+            lines.append(name + ': peak ' + str(round(peak/(1024.0*1024.0), 1)) + ' MB, kept ' +
+                str(round(remaining/(1024.0*1024.0), 1)) + ' MB')
+        return '\n'.join(lines)
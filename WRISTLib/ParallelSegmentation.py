@@ -0,0 +1,375 @@
+#############################################################################################
+###MULTIPROCESSOR HELPER CLASS###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+import time
+import multiprocessing
+import os
+import sys
+import shutil
+import tempfile
+
+from WRISTLib.BoneSegmentation import BoneSeg
+from WRISTLib.AnatomicPriors import GetBoneLabel
+from WRISTLib.SharedMemory import SharedVolume
+from WRISTLib.PreprocessingCache import DiskPreprocessingCache, ImageFingerprint
+from WRISTLib.IntensityStatistics import ImageStatistics
+
+
+class Multiprocessor(object):
+    """Helper class for seperating a segmentation class (such as from SimpleITK) into
+    several logical cores in parallel. Requires: SegmentationClass, Seed List, SimpleITK Image"""
+    def __init__(self):
+        self.segmentationClass = BoneSeg()
+        self.randomSeed = 0 # Base seed for the random number generator of each bone
+        self.results = [] # BoneResult of each bone of the last Execute (e.g. for the volume of each bone)
+        self.SharedPreprocessing = False # Preprocess the union of the search windows once (see SetSharedPreprocessing)
+
+    def Execute(self, seedList, MRI_Image, parameters, numCPUS, updateCallback = None, verbose = False):
+        self.seedList = seedList
+        self.MRI_Image = MRI_Image
+        self.parameters = parameters
+        self.numCPUS = max(1, int(numCPUS))
+        self.verbose = verbose #Print output text to terminal or not
+        # For updating the view between each bone (e.g. in 3D Slicer). Called as updateCallback(segmentationArray, 
+        # lowerIndex, upperIndex) with the label array (z,y,x) and the region (x,y,z) that changed
+        self.updateCallback = updateCallback
+
+        #Convert to voxel coordinates
+        self.RoundSeedPoints() 
+
+        # Seed of each label (for deciding which bone a voxel belongs to where two bones overlap, see CompositeLabel)
+        self.labelSeeds = {}
+        for x in range(len(self.seedList)):
+            self.labelSeeds[GetBoneLabel(self.parameters[5][x])] = np.asarray(self.seedList[x])
+
+        #Create an empty segmentationLabel array (each bone is written into it in place)
+        segmentationArray = np.zeros(sitk.GetArrayViewFromImage(self.MRI_Image).shape, dtype=np.uint16)
+
+        self.results = []
+        segmentations = None
+        try:
+            # Hash the MRI and compute its statistics once for all of the bones (only for this run, in case the image changes afterwards)
+            self.SetInputInformation()
+
+            # Segment each bone in its own worker process if more than one CPU was selected
+            if self.numCPUS > 1 and len(self.seedList) > 1:
+                segmentations = self.RunParallel()
+            else:
+                segmentations = self.RunSerial()
+
+            # Merge each bone into the label image as soon as it is finished
+            for tempOutput in segmentations:
+                if tempOutput is None:
+                    # The stop button was pressed
+                    continue
+
+                # Each bone is returned as a BoneResult (the mask of its bounding box and the index of its first corner)
+                self.results.append(tempOutput)
+                self.CompositeLabel(segmentationArray, tempOutput.GetLabelArray(), tempOutput.lowerIndex)
+
+                # Update the view between each bone (no updateCallback in the command line mode)
+                # Only the bounding box of the bone changed, so only that region needs to be copied
+                if self.updateCallback is not None:
+                    self.updateCallback(segmentationArray, tempOutput.lowerIndex, tempOutput.GetUpperIndex())
+                    self.segmentationClass.ProcessEvents()
+        finally:
+            # Closing the generator stops the worker pool and removes the shared volume right away if an error
+            # stopped the loop (e.g. in CompositeLabel or the updateCallback)
+            if segmentations is not None:
+                segmentations.close()
+            self.segmentationClass.SetInputInformation(None, None)
+            self.segmentationClass.PreprocessingUnion = None # Only for this run (see PreprocessShared)
+
+        return self.ArrayToImage(segmentationArray)
+
+    def SetInputInformation(self):
+        # Fingerprint of the MRI for the preprocessing and diffusion caches (if any) and its intensity statistics for
+        # the sigmoid threshold estimation (if needed), passed to the segmentation class
+        segmentationClass = self.segmentationClass
+        self.fingerprint = None
+        if segmentationClass.preprocessing_cache is not None or segmentationClass.diffusion_cache is not None:
+            self.fingerprint = ImageFingerprint(self.MRI_Image)
+
+        self.statistics = None
+        if segmentationClass.SigmoidEstimation == 'volume' and self.parameters[9] == 0:
+            self.statistics = ImageStatistics(self.MRI_Image)
+
+        segmentationClass.SetInputInformation(self.fingerprint, self.statistics)
+
+    def CompositeLabel(self, segmentationArray, cropArray, cropLowerIndex):
+        ''' Write the labels of a cropped segmentation into the label array at cropLowerIndex. Adding the labels 
+        would turn two touching bones into a third label (e.g. Scaphoid 3 + Capitate 4 = Triquetrum 7), so 
+        where a voxel already has a label it goes to the bone whose seed is closest (in mm) instead. The
+        result doesn't depend on the order the bones finish in. '''
+        cropUpperIndex = np.asarray(cropLowerIndex) + cropArray.shape[::-1]
+
+        # In numpy an array is indexed in the opposite order (z,y,x) (this is a view, not a copy)
+        region = segmentationArray[cropLowerIndex[2]:cropUpperIndex[2],
+                                cropLowerIndex[1]:cropUpperIndex[1],
+                                cropLowerIndex[0]:cropUpperIndex[0]]
+
+        overlap = (region != 0) & (cropArray != 0)
+        if not overlap.any():
+            np.copyto(region, cropArray, where=cropArray != 0)
+            return region
+
+        # Only the overlapping voxels are compared
+        spacing = np.asarray(self.MRI_Image.GetSpacing())[::-1]
+        voxels = np.argwhere(overlap) + np.asarray(cropLowerIndex)[::-1]
+        oldLabels = region[overlap]
+        newLabels = cropArray[overlap].astype(region.dtype)
+
+        oldDistance = np.zeros(len(voxels))
+        for label in np.unique(oldLabels):
+            inside = oldLabels == label
+            oldDistance[inside] = self.SeedDistance(voxels[inside], label, spacing)
+        newDistance = self.SeedDistance(voxels, newLabels[0], spacing)
+
+        # Ties go to the lower label
+        keepNew = (newDistance < oldDistance) | ((newDistance == oldDistance) & (newLabels < oldLabels))
+
+        np.copyto(region, cropArray, where=(cropArray != 0) & ~overlap)
+        region[overlap] = np.where(keepNew, newLabels, oldLabels)
+
+        return region
+
+    def SeedDistance(self, voxels, label, spacing):
+        # Distance (mm) of each voxel (z,y,x) to the seed of the label
+        seed = self.labelSeeds.get(int(label))
+        if seed is None:
+            return np.full(len(voxels), np.inf)
+        return np.sqrt((((voxels - seed[::-1])*spacing)**2).sum(axis=1))
+
+    def ArrayToImage(self, segmentationArray):
+        # Convert the label array to a SimpleITK image with the same information as the MRI
+        segmentationLabel = sitk.Cast(sitk.GetImageFromArray(segmentationArray), self.MRI_Image.GetPixelID())
+        segmentationLabel.CopyInformation(self.MRI_Image)
+
+        return segmentationLabel
+
+    def SetSharedPreprocessing(self, shared):
+        # Filter the image and create the edge map once over the union of the search windows of all of the bones
+        # instead of once per bone (the windows of neighboring bones overlap). An approximation: the crop of each
+        # bone is sliced out of the filtered union, which differs slightly from filtering it on its own (see BoneSeg.PreprocessUnion)
+        self.SharedPreprocessing = shared
+
+    def PreprocessShared(self, useDiskCache=False):
+        ''' Preprocess the union of the search windows of all of the bones into the preprocessing cache if
+        SharedPreprocessing is on. With useDiskCache it is also stored in a disk cache for the worker
+        processes (a temporary one in shared memory if there isn't one yet), which is returned so it can
+        be removed afterwards (see RemoveTemporaryCache) '''
+        cache = self.segmentationClass.preprocessing_cache
+        self.segmentationClass.PreprocessingUnion = None
+        if self.SharedPreprocessing == False or len(self.seedList) < 2 or cache is None:
+            return None
+
+        temporaryCache = None
+        if useDiskCache == True and cache.diskCache is None:
+            directory = tempfile.mkdtemp(prefix='WRIST_', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            temporaryCache = DiskPreprocessingCache(directory)
+            cache.SetDiskCache(temporaryCache)
+
+        SetSegmentationParameters(self.segmentationClass, self.parameters, 0)
+        self.segmentationClass.PreprocessUnion(self.MRI_Image, self.seedList, self.parameters[5], self.verbose)
+
+        return temporaryCache
+
+    def RemoveTemporaryCache(self, temporaryCache):
+        if temporaryCache is not None:
+            self.segmentationClass.preprocessing_cache.SetDiskCache(None)
+            shutil.rmtree(temporaryCache.directory, ignore_errors=True)
+
+    def RunSerial(self):
+        # Segment the bones one at a time using the segmentation class of the GUI
+        self.PreprocessShared()
+        for x in range(len(self.seedList)):
+            self.segmentationClass.ProcessEvents()
+
+            # Only run the segmentation function if the stop button in the GUI is set to false
+            yield self.RunSegmentation(self.seedList[x], x)
+
+    def RunParallel(self):
+        # Segment the bones in a pool of worker processes (one bone per task)
+        # and return each segmentation as soon as its worker is finished
+        numProcesses = min(self.numCPUS, len(self.seedList))
+
+        # Split the ITK threads between the workers to avoid oversubscribing the CPU
+        numThreads = max(1, multiprocessing.cpu_count() // numProcesses)
+
+        if self.verbose == True:
+            print('Segmenting ' + str(len(self.seedList)) + ' bones using ' + str(numProcesses) + ' processes')
+
+        # Everything which creates a temporary file (or processes) is within the try so it is always removed
+        temporaryCache = None
+        sharedVolume = None
+        pool = None
+        try:
+            # The workers read the shared preprocessing from the disk cache
+            temporaryCache = self.PreprocessShared(useDiskCache=True)
+
+            # Flags from the GUI that the segmentation class in each worker needs as well
+            options = self.segmentationClass.GetOptions()
+            options['verbose'] = self.verbose # Print when each bone is done (as RunSegmentation)
+
+            # Put the MRI in shared memory once instead of sending a copy of it to every worker
+            sharedVolume = SharedVolume(self.MRI_Image)
+            sharedVolume.fingerprint = self.fingerprint # Hashed once for the preprocessing cache instead of in every worker
+            sharedVolume.statistics = self.statistics # Same for the intensity statistics of the sigmoid threshold estimation
+
+            pool = GetPoolContext().Pool(processes=numProcesses, initializer=InitializeWorker, initargs=(numThreads,))
+
+            pending = []
+            for x in range(len(self.seedList)):
+                task = (sharedVolume, self.seedList[x], x, self.parameters, options, self.GetRandomSeed(x))
+                pending.append(pool.apply_async(RunSegmentationWorker, (task,)))
+
+            while pending:
+                self.segmentationClass.ProcessEvents()
+
+                # Stop all the workers if the stop button in the GUI was pressed
+                if self.segmentationClass.stop_segmentation == True:
+                    pool.terminate()
+                    return
+
+                finished = [result for result in pending if result.ready()]
+                for result in finished:
+                    pending.remove(result)
+                    yield result.get()
+
+                if not finished:
+                    time.sleep(0.05)
+
+            pool.close()
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+            if sharedVolume is not None:
+                sharedVolume.Close()
+            self.RemoveTemporaryCache(temporaryCache)
+
+    def GetRandomSeed(self, ndx):
+        # Each bone gets its own seed so the leakage check gives the same result
+        # regardless of the number of CPUs used
+        return self.randomSeed + ndx
+
+    def RunSegmentation(self, SeedPoint, ndx):
+        """ Run the segmentation for a single bone using the segmentation class of the GUI
+            (see RunSegmentationWorker for running in a seperate process) """
+        SetSegmentationParameters(self.segmentationClass, self.parameters, ndx)
+        self.segmentationClass.SetRandomSeed(self.GetRandomSeed(ndx))
+
+        segmentation = self.segmentationClass.Execute(self.MRI_Image, [SeedPoint], verbose=True, 
+                                    returnSitkImage=False, convertSeedPhyscialFlag=False, returnCroppedImage=True)
+
+        if self.verbose == True:
+            print('Done with the segmentation of ' + self.parameters[5][ndx])
+
+        return segmentation
+
+    def RoundSeedPoints(self):           
+        seeds = []
+        for i in range(0,len(self.seedList)): #Select which bone (or all of them) from the csv file
+            #Convert from string to float
+            # tempFloat = [float(self.seedList[i][0])/(-0.24), float(self.seedList[i][1])/(-0.24), float(self.seedList[i][2])/(0.29)]
+            tempFloat = [float(self.seedList[i][0]), float(self.seedList[i][1]), float(self.seedList[i][2])]
+            
+            #Convert from physical units to voxel coordinates
+            tempVoxelCoordinates = self.MRI_Image.TransformPhysicalPointToContinuousIndex(tempFloat)
+            seeds.append(tempVoxelCoordinates)
+
+        self.seedList = seeds
+        return self
+
+
+def SetSegmentationParameters(segmentationClass, parameters, ndx):
+    # Change the parameters of the segmentation class to the ones selected in the GUI
+    # parameters = [self.ShapeCurvatureScale, self.ShapeMaxRMSError, self.ShapeMaxIts, 
+    #                 self.ShapePropagationScale, self.selected_gender, self.BonesSelected, self.RelaxationAmount,
+    #                 self.DiffusionIts, self.dilate_image.checked, self.SigmoidThreshold] 
+
+    # Shape Detection Filter
+    segmentationClass.SetShapeCurvatureScale(parameters[0])
+    segmentationClass.SetShapeMaxRMSError(parameters[1])
+    segmentationClass.SetShapeMaxIterations(parameters[2])
+    segmentationClass.SetShapePropagationScale(parameters[3])
+    segmentationClass.SetPatientGender(parameters[4])
+    segmentationClass.SetCurrentBone(parameters[5][ndx])
+    segmentationClass.SetAnatomicalRelaxation(parameters[6])
+    segmentationClass.SetAnisotropicIts(parameters[7])
+    segmentationClass.DilateImage = parameters[8]
+
+    # Only set the sigmoid filter threshold if the user selected on (not equal to the default of zero)
+    if parameters[9] != 0:
+        segmentationClass.SkipTresholdCalculation = True
+
+        # Check to see if we are segmenting bright or dark bones
+        # Essentially, just flip the lower and upper threshold of the levelset
+        if segmentationClass.flip_sigmoid == False: 
+            segmentationClass.SetLevelSetLowerThreshold(parameters[9])
+            segmentationClass.SetLevelSetUpperThreshold(0)
+        else:
+            segmentationClass.SetLevelSetLowerThreshold(0)
+            segmentationClass.SetLevelSetUpperThreshold(parameters[9])
+    else:
+        segmentationClass.SkipTresholdCalculation = False
+
+
+def GetPythonExecutable():
+    ''' The Python interpreter for the worker processes if running embedded in another program (e.g. in 3D Slicer,
+    where sys.executable is the Slicer application), None if sys.executable is the Python interpreter '''
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return None
+
+    # Slicer comes with PythonSlicer next to its executable
+    directories = [os.path.dirname(sys.executable), os.path.join(sys.exec_prefix, 'bin'), sys.exec_prefix]
+    for directory in directories:
+        for name in ['PythonSlicer', 'PythonSlicer.exe', 'python3', 'python', 'python.exe']:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+
+    raise RuntimeError('Unable to find the Python interpreter for the worker processes (running in ' + str(sys.executable) + ')')
+
+def GetPoolContext():
+    ''' Multiprocessing context of the worker pool. Forks on Linux with a plain Python interpreter, otherwise the workers
+    are started (spawned) with a Python interpreter, which is set explicitly when running embedded (e.g. in 3D Slicer) '''
+    executable = GetPythonExecutable()
+    if executable is None:
+        return multiprocessing.get_context('fork' if sys.platform.startswith('linux') else 'spawn')
+
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(executable)
+    return context
+
+def InitializeWorker(numThreads):
+    # Runs once in each worker process of the Multiprocessor pool
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(numThreads)
+
+def RunSegmentationWorker(task):
+    """ Function to be used with the Multiprocessor class (needs to be its own function 
+        and not part of the same class to avoid the 'Pickle' type errors. """
+    sharedVolume, SeedPoint, ndx, parameters, options, randomSeed = task
+
+    # Each worker uses its own segmentation class since they can't be shared between processes
+    segmentationClass = BoneSeg()
+    segmentationClass.SetOptions(options) # No callbacks since there is no GUI in the worker process
+    segmentationClass.SetRandomSeed(randomSeed)
+
+    SetSegmentationParameters(segmentationClass, parameters, ndx)
+
+    # Only the mask of the bounding box of the bone is sent back to the main process (see BoneResult)
+    segmentation = segmentationClass.Execute(sharedVolume, [SeedPoint], verbose=True, 
+                                returnSitkImage=False, convertSeedPhyscialFlag=False, returnCroppedImage=True)
+
+    if options.get('verbose') == True:
+        print('Done with the segmentation of ' + parameters[5][ndx])
+
+    return segmentation
@@ -0,0 +1,346 @@
+#############################################################################################
+###CACHE OF THE PREPROCESSED (CROPPED, FILTERED) IMAGES###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+
+def ArrayFingerprint(nda, origin, spacing, direction):
+    # Content hash of the voxels (numpy array) along with the image information
+    digest = hashlib.sha1()
+    header = (tuple(nda.shape), nda.dtype.str,
+        tuple(np.round(np.asarray(origin, dtype=float), 6).tolist()),
+        tuple(np.round(np.asarray(spacing, dtype=float), 6).tolist()),
+        tuple(np.round(np.asarray(direction, dtype=float).flatten(), 6).tolist()))
+    digest.update(str(header).encode('utf-8'))
+    digest.update(np.ascontiguousarray(nda).data)
+
+    return digest.hexdigest()
+
+
+def ImageFingerprint(image):
+    ''' Content hash of a SimpleITK image (or SharedVolume), so a re-loaded copy of the same MRI gives the same key.
+    Hashes the whole image, so compute it once per run and pass it on (see BoneSeg.SetInputInformation) '''
+    if hasattr(image, 'GetFingerprint'):
+        return image.GetFingerprint() # SharedVolume (computed once before it is sent to the workers)
+
+    return ArrayFingerprint(sitk.GetArrayViewFromImage(image),
+        image.GetOrigin(), image.GetSpacing(), image.GetDirection())
+
+
+def ImageBytes(image):
+    # Size of the voxel buffer of a SimpleITK image
+    nda = sitk.GetArrayViewFromImage(image)
+    return nda.size*nda.itemsize
+
+
+class DiskPreprocessingCache(object):
+    """Persistent cache of the preprocessed crops in a directory, so re-opening the same study
+    (e.g. in a later 3D Slicer session) starts at the level set. Each entry is a folder with the
+    filtered image and the edge potential map saved as .npy files, which are memory mapped when
+    read so only the requested region is loaded. With compress they are saved in a compressed .npz
+    file instead, in chunks of chunkSlices slices (z). A compressed entry can't be memory mapped,
+    but only the chunks overlapping the requested region are decompressed.
+    Only a crop with exactly the requested bounds is used (see PreprocessingCache.Lookup), so the
+    result doesn't depend on which crops were stored before (e.g. by another worker process).
+    The least recently used entries are removed when the folder is larger than maxBytes.
+    Several processes can share the folder (entries are written to a temporary folder first)."""
+    def __init__(self, directory, maxBytes=4*1024*1024*1024, compress=False, chunkSlices=8):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.compress = compress
+        self.chunkSlices = chunkSlices
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                pass # Created by another process
+
+    def GetGroupDirectory(self, imageKey, parameters):
+        # One folder per image and set of filter parameters, the crop bounds are in the entry folder name
+        digest = hashlib.sha1(str((imageKey, tuple(parameters))).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def GetEntryName(self, lowerIndex, upperIndex):
+        return '_'.join([str(int(i)) for i in lowerIndex]) + '-' + '_'.join([str(int(i)) for i in upperIndex])
+
+    def Lookup(self, imageKey, parameters, lowerIndex, upperIndex, region=None):
+        ''' Return the (filtered image, edge potential map) of the crop [lowerIndex, upperIndex) or None if not cached.
+        With region ([lowerIndex, upperIndex) in the image, inside of the crop) only that part of the crop is read '''
+        entryDirectory = os.path.join(self.GetGroupDirectory(imageKey, parameters), self.GetEntryName(lowerIndex, upperIndex))
+        if not os.path.isdir(entryDirectory):
+            return None
+
+        if region is None:
+            region = (lowerIndex, upperIndex)
+        # Only copy the requested region (indexed in the order z,y,x)
+        offset = np.asarray(region[0], dtype=int) - np.asarray(lowerIndex, dtype=int)
+        size = np.asarray(region[1], dtype=int) - np.asarray(region[0], dtype=int)
+        regionSlices = (slice(offset[2], offset[2] + size[2]), slice(offset[1], offset[1] + size[1]), slice(offset[0], offset[0] + size[0]))
+
+        try:
+            with open(os.path.join(entryDirectory, 'info.json')) as infoFile:
+                info = json.load(infoFile)
+
+            if os.path.exists(os.path.join(entryDirectory, 'crop.npz')):
+                with np.load(os.path.join(entryDirectory, 'crop.npz')) as arrays:
+                    image = self.ReadChunks(arrays, 'image', info.get('chunkSlices'), regionSlices)
+                    edgePotentialMap = self.ReadChunks(arrays, 'edge', info.get('chunkSlices'), regionSlices)
+            else:
+                image = np.load(os.path.join(entryDirectory, 'image.npy'), mmap_mode='r')[regionSlices]
+                edgePotentialMap = np.load(os.path.join(entryDirectory, 'edge.npy'), mmap_mode='r')[regionSlices]
+
+            os.utime(entryDirectory, None) # Most recently used
+        except (IOError, OSError, ValueError, KeyError):
+            return None # Removed (or being removed) by another process
+
+        origin = np.asarray(info['origin']) + np.asarray(info['direction']).reshape(3,3).dot(np.asarray(info['spacing'])*offset)
+
+        images = []
+        for nda in [image, edgePotentialMap]:
+            crop = sitk.GetImageFromArray(np.ascontiguousarray(nda))
+            crop.SetOrigin(origin.tolist())
+            crop.SetSpacing(info['spacing'])
+            crop.SetDirection(info['direction'])
+            images.append(crop)
+
+        return images[0], images[1]
+
+    def ReadChunks(self, arrays, name, chunkSlices, regionSlices):
+        # Decompress only the chunks (of chunkSlices slices along z) of a .npz entry overlapping the region (z,y,x slices)
+        if chunkSlices is None:
+            return arrays[name][regionSlices] # Written in one piece
+
+        first = regionSlices[0].start//chunkSlices
+        last = (regionSlices[0].stop - 1)//chunkSlices
+        nda = np.concatenate([arrays[name + '_' + str(k)] for k in range(first, last + 1)])
+
+        z = slice(regionSlices[0].start - first*chunkSlices, regionSlices[0].stop - first*chunkSlices)
+        return nda[(z,) + tuple(regionSlices[1:])]
+
+    def Store(self, imageKey, parameters, lowerIndex, upperIndex, image, edgePotentialMap):
+        groupDirectory = self.GetGroupDirectory(imageKey, parameters)
+        entryDirectory = os.path.join(groupDirectory, self.GetEntryName(lowerIndex, upperIndex))
+        if os.path.isdir(entryDirectory):
+            return
+
+        try:
+            if not os.path.isdir(groupDirectory):
+                os.makedirs(groupDirectory)
+        except OSError:
+            pass # Created by another process
+
+        # Write to a temporary folder and rename it, so other processes never see a partial entry
+        try:
+            tempDirectory = tempfile.mkdtemp(prefix='tmp', dir=groupDirectory)
+        except OSError:
+            return
+
+        try:
+            info = {'origin':list(image.GetOrigin()), 'spacing':list(image.GetSpacing()), 'direction':list(image.GetDirection())}
+            if self.compress == True:
+                info['chunkSlices'] = self.chunkSlices
+            with open(os.path.join(tempDirectory, 'info.json'), 'w') as infoFile:
+                json.dump(info, infoFile)
+
+            if self.compress == True:
+                # Compressed in chunks of slices, so a region is read without decompressing the whole crop
+                arrays = {}
+                for name, nda in [('image', sitk.GetArrayViewFromImage(image)), ('edge', sitk.GetArrayViewFromImage(edgePotentialMap))]:
+                    for k in range(0, nda.shape[0], self.chunkSlices):
+                        arrays[name + '_' + str(k//self.chunkSlices)] = nda[k:k + self.chunkSlices]
+                np.savez_compressed(os.path.join(tempDirectory, 'crop.npz'), **arrays)
+            else:
+                np.save(os.path.join(tempDirectory, 'image.npy'), sitk.GetArrayViewFromImage(image))
+                np.save(os.path.join(tempDirectory, 'edge.npy'), sitk.GetArrayViewFromImage(edgePotentialMap))
+
+            os.rename(tempDirectory, entryDirectory)
+        except (IOError, OSError):
+            shutil.rmtree(tempDirectory, ignore_errors=True) # e.g. already written by another process or the disk is full
+            return
+
+        self.Evict()
+
+    def Evict(self):
+        ' Remove the least recently used entries until the cache folder is smaller than maxBytes '
+        entries = []
+        totalBytes = 0
+        for groupName in os.listdir(self.directory):
+            groupDirectory = os.path.join(self.directory, groupName)
+            if not os.path.isdir(groupDirectory):
+                continue
+            for name in os.listdir(groupDirectory):
+                entryDirectory = os.path.join(groupDirectory, name)
+                if name.startswith('tmp'):
+                    continue
+                try:
+                    numBytes = sum([os.path.getsize(os.path.join(entryDirectory, f)) for f in os.listdir(entryDirectory)])
+                    entries.append((os.path.getmtime(entryDirectory), numBytes, entryDirectory))
+                except OSError:
+                    continue
+                totalBytes = totalBytes + numBytes
+
+        entries.sort()
+        for lastUsed, numBytes, entryDirectory in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            shutil.rmtree(entryDirectory, ignore_errors=True)
+            totalBytes = totalBytes - numBytes
+
+    def Clear(self):
+        for groupName in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, groupName), ignore_errors=True)
+
+
+class PreprocessingCache(object):
+    """Bounded, least recently used cache of the preprocessed crops (the anisotropic diffusion filtered
+    image and the edge potential map) of each bone. Entries are keyed on the image content, the
+    filter parameters, and the crop bounds. Only a crop with exactly the requested bounds is used:
+    the diffusion of a crop depends on the whole crop, so the same region of a larger filtered crop
+    differs (see the region of Lookup for the shared preprocessing, which accepts this).
+    Misses are looked up in the (optional) DiskPreprocessingCache, see SetDiskCache."""
+    def __init__(self, maxBytes=512*1024*1024, diskCache=None):
+        self.maxBytes = maxBytes # Total size of the cached images (in bytes)
+        self.numBytes = 0
+        self.entries = OrderedDict() # Least recently used first
+        self.diskCache = diskCache
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Only the settings (and the disk cache folder) are sent to the worker processes
+        state = self.__dict__.copy()
+        state['entries'] = OrderedDict()
+        state['numBytes'] = 0
+        return state
+
+    def SetDiskCache(self, diskCache):
+        # DiskPreprocessingCache (or None) shared between sessions and processes
+        self.diskCache = diskCache
+
+    def Lookup(self, imageKey, parameters, lowerIndex, upperIndex, region=None):
+        ''' Return the (filtered image, edge potential map) of the crop [lowerIndex, upperIndex) or None if not cached.
+        With region ([lowerIndex, upperIndex) in the image, inside of the crop) only that part of the crop is returned.
+        It is only an approximation of filtering the region on its own (see BoneSeg.PreprocessUnion) '''
+        key = (imageKey, tuple(parameters), tuple(lowerIndex), tuple(upperIndex))
+
+        if key not in self.entries:
+            if self.diskCache is not None:
+                cached = self.diskCache.Lookup(imageKey, parameters, lowerIndex, upperIndex, region)
+                if cached is not None:
+                    self.hits = self.hits + 1
+                    if region is None:
+                        self.Store(imageKey, parameters, lowerIndex, upperIndex, cached[0], cached[1], False)
+                    return cached
+
+            self.misses = self.misses + 1
+            return None
+
+        entry = self.entries.pop(key)
+        self.entries[key] = entry # Move to the most recently used
+        self.hits = self.hits + 1
+
+        if region is None:
+            return entry[0], entry[1]
+
+        # Slice the region out of the cached crop (RegionOfInterest keeps the physical location)
+        index = np.subtract(region[0], lowerIndex).astype(int).tolist()
+        size = np.subtract(region[1], region[0]).astype(int).tolist()
+
+        return (sitk.RegionOfInterest(entry[0], size, index),
+                sitk.RegionOfInterest(entry[1], size, index))
+
+    def Store(self, imageKey, parameters, lowerIndex, upperIndex, image, edgePotentialMap, storeOnDisk=True):
+        key = (imageKey, tuple(parameters), tuple(lowerIndex), tuple(upperIndex))
+        numBytes = ImageBytes(image) + ImageBytes(edgePotentialMap)
+
+        if storeOnDisk == True and self.diskCache is not None:
+            self.diskCache.Store(imageKey, parameters, lowerIndex, upperIndex, image, edgePotentialMap)
+
+        if numBytes > self.maxBytes:
+            return # Too large to cache
+
+        if key in self.entries:
+            self.numBytes = self.numBytes - self.entries.pop(key)[2]
+
+        self.entries[key] = (image, edgePotentialMap, numBytes)
+        self.numBytes = self.numBytes + numBytes
+
+        # Remove the least recently used entries until the cache fits
+        while self.numBytes > self.maxBytes:
+            self.numBytes = self.numBytes - self.entries.popitem(last=False)[1][2]
+
+    def SetMaxBytes(self, maxBytes):
+        self.maxBytes = maxBytes
+        while self.numBytes > self.maxBytes:
+            self.numBytes = self.numBytes - self.entries.popitem(last=False)[1][2]
+
+    def Clear(self):
+        self.entries.clear()
+        self.numBytes = 0
+
+
+class DiffusionCache(object):
+    """Bounded, least recently used cache of the anisotropic diffusion of a crop after each number of
+    iterations computed so far. The diffusion is iterative, so a higher number of iterations continues
+    from the cached result with the most iterations (up to the requested number) instead of starting
+    over, e.g. going from 5 to 7 iterations only runs 2 more. Keyed on the image, the crop, and the
+    time step and conductance of the filter."""
+    def __init__(self, maxBytes=256*1024*1024):
+        self.maxBytes = maxBytes
+        self.numBytes = 0
+        self.entries = OrderedDict() # (key, iterations): (image, numBytes), least recently used first
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['entries'] = OrderedDict()
+        state['numBytes'] = 0
+        return state
+
+    def Lookup(self, key, iterations):
+        ' Return (iterations, filtered image) with the most iterations up to the requested number or (0, None) '
+        best = None
+        for cachedKey in self.entries:
+            if cachedKey[0] == key and cachedKey[1] <= iterations:
+                if best is None or cachedKey[1] > best[1]:
+                    best = cachedKey
+
+        if best is None:
+            return 0, None
+
+        entry = self.entries.pop(best)
+        self.entries[best] = entry # Move to the most recently used
+
+        return best[1], entry[0]
+
+    def Store(self, key, iterations, image):
+        numBytes = ImageBytes(image)
+        if numBytes > self.maxBytes:
+            return # Too large to cache
+
+        if (key, iterations) in self.entries:
+            self.numBytes = self.numBytes - self.entries.pop((key, iterations))[1]
+
+        self.entries[(key, iterations)] = (image, numBytes)
+        self.numBytes = self.numBytes + numBytes
+
+        while self.numBytes > self.maxBytes:
+            self.numBytes = self.numBytes - self.entries.popitem(last=False)[1][1]
+
+    def Clear(self):
+        self.entries.clear()
+        self.numBytes = 0
+
+
+# Shared by all of the BoneSeg instances in a process (see BoneSeg.SetPreprocessingCache and SetDiffusionCache)
+DefaultPreprocessingCache = PreprocessingCache()
+DefaultDiffusionCache = DiffusionCache()
@@ -0,0 +1,155 @@
+#############################################################################################
+###BACKGROUND PREVIEWS OF THE FILTERED IMAGE###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+import threading
+import time
+
+from WRISTLib.EdgePotential import EdgePotentialMap
+
+
+class PreviewEngine(object):
+    """Computes the previews of the filtered image (e.g. while dragging the sigmoid or diffusion slider)
+    in a background thread. A request is only started once no newer request with the same name has
+    arrived for delay seconds, and a running computation is aborted as soon as a newer request arrives.
+    The finished previews are collected with Poll() (e.g. from a timer in the GUI thread, since the
+    results need to be shown from there)."""
+    def __init__(self, delay=0.25):
+        self.delay = delay # Seconds without a newer request before starting (debouncing the slider)
+        self.condition = threading.Condition()
+        self.pending = {} # name: (request time, compute, args) of the newest request
+        self.finished = {} # name: result
+        self.running = None # Name of the request being computed
+        self.thread = None
+        self.closed = False
+
+    def Request(self, name, compute, *args):
+        ''' Compute compute(isStale, *args) in the background, replacing any earlier request with the same name.
+        isStale() returns True once the result isn't needed anymore (see AbortWhenStale) '''
+        with self.condition:
+            self.pending[name] = (time.time(), compute, args)
+            self.finished.pop(name, None)
+            self.closed = False
+            self.condition.notify()
+
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.Run, name='WRIST preview')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def Poll(self):
+        # The finished previews (name: result) since the last call
+        with self.condition:
+            finished = self.finished
+            self.finished = {}
+        return finished
+
+    def IsBusy(self):
+        with self.condition:
+            return len(self.pending) > 0 or self.running is not None or len(self.finished) > 0
+
+    def IsStale(self, name):
+        # A newer request replaced this one (only the newest request is kept in pending)
+        with self.condition:
+            return self.closed or name in self.pending
+
+    def Close(self):
+        with self.condition:
+            self.closed = True
+            self.pending = {}
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def Run(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0 and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+
+                # Start with the oldest request once it had delay seconds without being replaced
+                name = min(self.pending, key=lambda n: self.pending[n][0])
+                requestTime, compute, args = self.pending[name]
+                wait = requestTime + self.delay - time.time()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                del self.pending[name]
+                self.running = name
+
+            isStale = lambda: self.IsStale(name)
+            try:
+                result = compute(isStale, *args)
+            except Exception as error:
+                result = None
+                if not isStale():
+                    print('Unable to compute the preview ' + name + ': ' + str(error))
+
+            with self.condition:
+                self.running = None
+                if result is not None and not isStale():
+                    self.finished[name] = result
+
+
+def AbortWhenStale(imageFilter, isStale):
+    # Abort the SimpleITK filter (its Execute raises a RuntimeError) as soon as a newer preview was requested
+    imageFilter.AddCommand(sitk.sitkProgressEvent, lambda: imageFilter.Abort() if isStale() else None)
+    return imageFilter
+
+
+def PreviewRegion(image, seedPoints, margin):
+    ''' Region (lowerIndex, size) of the image around the seed points (physical LPS coordinates)
+    plus margin mm on each side. The whole image if there are no seed points '''
+    size = np.asarray(image.GetSize())
+    if len(seedPoints) == 0:
+        return [0,0,0], size.tolist()
+
+    seeds = np.asarray([image.TransformPhysicalPointToContinuousIndex([float(i) for i in point]) for point in seedPoints])
+    margin = np.ceil(margin/np.asarray(image.GetSpacing()))
+
+    lowerIndex = np.clip(np.floor(seeds.min(axis=0) - margin), 0, size - 1).astype(int)
+    upperIndex = np.clip(np.ceil(seeds.max(axis=0) + margin) + 1, lowerIndex + 1, size).astype(int)
+
+    return lowerIndex.tolist(), (upperIndex - lowerIndex).tolist()
+
+
+def PreviewEdgePotential(isStale, image, alpha, beta, mode='reference', sigma=1.0):
+    # Same edge potential map as BoneSeg.PreprocessLevelSet (see EdgePotentialMap)
+    sigFilter = AbortWhenStale(sitk.SigmoidImageFilter(), isStale)
+    sigFilter.SetAlpha(alpha)
+    sigFilter.SetBeta(beta)
+    sigFilter.SetOutputMinimum(0)
+    sigFilter.SetOutputMaximum(255)
+
+    return EdgePotentialMap(image, sigFilter, mode, sigma)
+
+
+def PreviewAnisotropicDiffusion(isStale, image, iterations, timeStep, conductance, cache=None, key=None):
+    # Same anisotropic diffusion as BoneSeg.apply_AnisotropicFilter. With a DiffusionCache (and a key for
+    # the image region) only the iterations beyond the closest earlier preview are computed
+    iterations = int(iterations)
+    done = 0
+    if cache is not None:
+        done, cached = cache.Lookup((key, timeStep, conductance), iterations)
+        if cached is not None:
+            image = cached
+            if done == iterations:
+                return image
+
+    anisotropicFilter = AbortWhenStale(sitk.CurvatureAnisotropicDiffusionImageFilter(), isStale)
+    anisotropicFilter.SetNumberOfIterations(iterations - done)
+    anisotropicFilter.SetTimeStep(timeStep)
+    anisotropicFilter.SetConductanceParameter(conductance)
+
+    image = anisotropicFilter.Execute(sitk.Cast(image, sitk.sitkFloat32))
+    if cache is not None:
+        cache.Store((key, timeStep, conductance), iterations, image)
+
+    return image
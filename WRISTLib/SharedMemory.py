@@ -0,0 +1,121 @@
+#############################################################################################
+###SHARED MEMORY TRANSPORT OF THE MRI TO THE WORKER PROCESSES###
+#############################################################################################
+
+import SimpleITK as sitk
+import numpy as np
+
+import tempfile
+import os
+
+from WRISTLib.PreprocessingCache import ArrayFingerprint
+from WRISTLib.IntensityStatistics import ArrayStatistics
+
+
+class SharedVolume(object):
+    """Read-only copy of a SimpleITK image in shared memory (a memory mapped file) along with
+    its origin, spacing and direction. Only the file name and image information are pickled, so
+    sending it to a worker process is cheap and each worker reads just the region it needs."""
+    def __init__(self, image):
+        # Use the shared memory file system if there is one (Linux), otherwise a temporary file
+        if os.path.isdir('/dev/shm'):
+            fileID, self.filename = tempfile.mkstemp(prefix='WRIST_', suffix='.dat', dir='/dev/shm')
+        else:
+            fileID, self.filename = tempfile.mkstemp(prefix='WRIST_', suffix='.dat')
+        os.close(fileID)
+
+        nda = sitk.GetArrayViewFromImage(image)
+        self.shape = nda.shape
+        self.dtype = nda.dtype.str
+        self.pixelID = image.GetPixelID()
+        self.origin = np.asarray(image.GetOrigin(), dtype=float)
+        self.spacing = np.asarray(image.GetSpacing(), dtype=float)
+        self.direction = np.asarray(image.GetDirection(), dtype=float).reshape(3,3)
+
+        # Copy the voxels into the shared memory once (removing the file again if that fails, e.g. /dev/shm is full)
+        try:
+            array = np.memmap(self.filename, dtype=self.dtype, mode='w+', shape=self.shape)
+            array[:] = nda
+            array.flush()
+            del array
+        except:
+            os.remove(self.filename)
+            raise
+
+        self.array = None
+        self.fingerprint = None # Content hash used by the PreprocessingCache (see GetFingerprint)
+        self.statistics = None # Intensity statistics used by BoneSeg.EstimateSigmoid (see GetStatistics)
+        self.owner = True # Only the process that created the file removes it
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['array'] = None
+        state['owner'] = False
+        return state
+
+    def GetArray(self):
+        # Read-only numpy view of the voxels (indexed in the order z,y,x)
+        if self.array is None:
+            self.array = np.memmap(self.filename, dtype=self.dtype, mode='r', shape=self.shape)
+        return self.array
+
+    def GetFingerprint(self):
+        # Computed once (call before sending to the workers so they don't each hash the image)
+        if self.fingerprint is None:
+            self.fingerprint = ArrayFingerprint(self.GetArray(), self.origin, self.spacing, self.direction)
+        return self.fingerprint
+
+    def GetStatistics(self):
+        # Computed once (call before sending to the workers so they don't each go through the whole image)
+        if self.statistics is None:
+            self.statistics = ArrayStatistics(self.GetArray())
+        return self.statistics
+
+    def GetCrop(self, lowerIndex, upperIndex):
+        # Create a SimpleITK image of the region from lowerIndex up to (not including) upperIndex
+        # Only this region is copied out of the shared memory
+        view = self.GetArray()[int(lowerIndex[2]):int(upperIndex[2]),
+                                int(lowerIndex[1]):int(upperIndex[1]),
+                                int(lowerIndex[0]):int(upperIndex[0])]
+        crop = sitk.GetImageFromArray(np.ascontiguousarray(view))
+        self.CopyInformationTo(crop, lowerIndex)
+
+        return crop
+
+    def CopyInformationTo(self, image, lowerIndex=(0,0,0)):
+        # Set the origin, spacing, and direction of an image which starts at lowerIndex in this volume
+        image.SetOrigin(self.TransformIndexToPhysicalPoint(lowerIndex))
+        image.SetSpacing(self.spacing.tolist())
+        image.SetDirection(self.direction.flatten().tolist())
+
+    def TransformIndexToPhysicalPoint(self, index):
+        point = self.origin + self.direction.dot(self.spacing*np.asarray(index, dtype=float))
+        return tuple(point.tolist())
+
+    def TransformPhysicalPointToContinuousIndex(self, point):
+        index = np.linalg.solve(self.direction, np.asarray(point, dtype=float) - self.origin)/self.spacing
+        return tuple(index.tolist())
+
+    def TransformPhysicalPointToIndex(self, point):
+        index = np.rint(self.TransformPhysicalPointToContinuousIndex(point)).astype(int)
+        return tuple(index.tolist())
+
+    def GetSize(self):
+        return tuple(self.shape[::-1])
+
+    def GetOrigin(self):
+        return tuple(self.origin.tolist())
+
+    def GetSpacing(self):
+        return tuple(self.spacing.tolist())
+
+    def GetDirection(self):
+        return tuple(self.direction.flatten().tolist())
+
+    def GetPixelID(self):
+        return self.pixelID
+
+    def Close(self):
+        self.array = None
+        if self.owner == True and os.path.exists(self.filename):
+            os.remove(self.filename)
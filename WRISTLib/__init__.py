@@ -0,0 +1,17 @@
+# The WRIST segmentation engine. Only depends on SimpleITK and NumPy so it can be used
+# without 3D Slicer (see WRIST.py for the Slicer module and the command line batch mode)
+
+from WRISTLib.AnatomicPriors import BoneList, Prior_Volumes, GetAnatomicPrior, GetBoneLabel
+from WRISTLib.PreprocessingCache import PreprocessingCache, DiskPreprocessingCache, DiffusionCache, DefaultPreprocessingCache, DefaultDiffusionCache, ImageFingerprint
+from WRISTLib.IntensityStatistics import IntensityStatistics, ArrayStatistics, ImageStatistics
+from WRISTLib.SharedMemory import SharedVolume
+from WRISTLib.MemoryProfile import MemoryProfile
+from WRISTLib.BoneResult import BoneResult
+from WRISTLib.EdgePotential import EdgePotentialMap, EdgePotentialModes, BenchmarkEdgePotential
+from WRISTLib.LevelSetInitialization import EllipsoidLevelSet, MaskLevelSet
+from WRISTLib.LevelSetEngines import (LevelSetEngine, LevelSetEngines, RegisterLevelSetEngine, GetLevelSetEngine,
+    RecordEngineCharacteristics, GetEngineCharacteristics, SelectLevelSetEngine, SaveEngineCharacteristics,
+    LoadEngineCharacteristics, BenchmarkLevelSetEngines)
+from WRISTLib.PreviewEngine import PreviewEngine
+from WRISTLib.BoneSegmentation import BoneSeg
+from WRISTLib.ParallelSegmentation import Multiprocessor, SetSegmentationParameters, RunSegmentationWorker
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from WRISTLib.BoneResult import BoneResult
+
+
+class BoneResultTest(unittest.TestCase):
+    def test_PackUnpackRoundTrip(self):
+        mask = np.zeros((10, 12, 14), dtype=np.uint8) # z,y,x
+        mask[2:5, 3:9, 4:7] = 1
+        mask[3, 5, 5] = 0 # A hole, so the mask is not just its bounding box
+
+        result = BoneResult('Lunate', 5, [10, 20, 30], mask, [0.5, 0.5, 2.0])
+
+        self.assertEqual(result.lowerIndex, [14, 23, 32])
+        self.assertEqual(result.size, [3, 6, 3])
+        self.assertEqual(result.GetUpperIndex(), [17, 29, 35])
+        self.assertTrue(np.array_equal(result.GetMask(), mask[2:5, 3:9, 4:7]))
+        self.assertEqual(result.voxelCount, int(mask.sum()))
+        self.assertAlmostEqual(result.GetVolume(), mask.sum()*0.5)
+
+        labels = result.GetLabelArray()
+        self.assertEqual(sorted(np.unique(labels).tolist()), [0, 5])
+
+    def test_LabelImage(self):
+        mask = np.zeros((10, 12, 14), dtype=np.uint8)
+        mask[2:5, 3:9, 4:7] = 1
+        result = BoneResult('Lunate', 5, [1, 2, 3], mask, [1, 1, 1])
+
+        reference = sitk.Image([20, 20, 20], sitk.sitkInt16)
+        labelImage = sitk.GetArrayFromImage(result.GetLabelImage(reference))
+
+        expected = np.zeros((20, 20, 20), dtype=np.uint8)
+        expected[5:8, 5:11, 5:8] = 5
+        self.assertTrue(np.array_equal(labelImage, expected))
+
+    def test_EmptyMask(self):
+        result = BoneResult('Pisiform', 8, [10, 20, 30], np.zeros((4, 5, 6), dtype=np.uint8), [1, 1, 1])
+
+        self.assertEqual(result.voxelCount, 0)
+        self.assertEqual(result.GetVolume(), 0)
+        self.assertEqual(result.size, [0, 0, 0])
+        self.assertEqual(result.GetMask().size, 0)
+        self.assertEqual(result.GetLabelArray().size, 0)
+
+        reference = sitk.Image([8, 8, 8], sitk.sitkInt16)
+        self.assertEqual(int(sitk.GetArrayFromImage(result.GetLabelImage(reference)).max()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from WRISTLib.AnatomicPriors import GetAnatomicPrior
+from WRISTLib.BoneSegmentation import BoneSeg
+
+
+class CropBoundsTest(unittest.TestCase):
+    def CropBounds(self, spacing, seedPoint, searchWindow=(10, 10, 10)):
+        segmentationClass = BoneSeg()
+        segmentationClass.image = sitk.Image([100, 100, 40], sitk.sitkInt16)
+        segmentationClass.image.SetSpacing(spacing)
+        segmentationClass.seedPoint = [seedPoint]
+        segmentationClass.searchWindow = np.asarray(searchWindow)
+
+        return segmentationClass.GetCropBounds()
+
+    def test_WindowInMillimetres(self):
+        # 10 mm is 10 voxels on each side at 0.5 mm, and 3 voxels (rounded up) at 2 mm
+        self.assertEqual(self.CropBounds([0.5, 0.5, 2], [50, 50, 20]), ([40, 40, 17], [61, 61, 24]))
+
+        # The same physical size with half the resolution
+        self.assertEqual(self.CropBounds([1, 1, 2], [50, 50, 20]), ([45, 45, 17], [56, 56, 24]))
+
+    def test_ClippedAtTheImageBorder(self):
+        # Only the side outside of the image is cut off
+        self.assertEqual(self.CropBounds([0.5, 0.5, 2], [3, 95, 1]), ([0, 85, 0], [14, 100, 5]))
+
+    def test_SearchWindowFromThePrior(self):
+        segmentationClass = BoneSeg()
+        segmentationClass.verbose = False
+        segmentationClass.SetPatientGender('Unknown')
+        segmentationClass.SetCurrentBone('Lunate')
+        segmentationClass.SetAnatomicalRelaxation(0)
+        segmentationClass.DefineAnatomicPrior()
+
+        # Twice the upper range (mean plus standard deviation) of the bone dimensions in mm
+        prior = GetAnatomicPrior('Unknown')
+        upperRange = np.rint([sum(prior['Lunate-' + axis]) for axis in ['x', 'y', 'z']])
+        self.assertTrue(np.array_equal(segmentationClass.searchWindow, np.rint(2*upperRange)))
+
+        # Larger with relaxation
+        searchWindow = segmentationClass.searchWindow
+        segmentationClass.SetAnatomicalRelaxation(0.5)
+        segmentationClass.DefineAnatomicPrior()
+        self.assertTrue(np.all(segmentationClass.searchWindow > searchWindow))
+
+
+if __name__ == '__main__':
+    unittest.main()
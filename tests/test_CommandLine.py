@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from WRISTLib.CommandLine import ReadSeedFile
+
+
+class ReadSeedFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def WriteFile(self, name, text):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w') as seedFile:
+            seedFile.write(text)
+        return filename
+
+    def test_HeaderlessMarkupsFileIsRAS(self):
+        filename = self.WriteFile('seeds.fcsv',
+            'vtkMRMLMarkupsFiducialNode_0,10.5,-20,30,0,0,0,1,1,1,0,Scaphoid,,\n')
+
+        bones, seedPoints = ReadSeedFile(filename)
+
+        self.assertEqual(bones, ['Scaphoid'])
+        self.assertEqual(seedPoints, [[-10.5, 20.0, 30.0]])
+
+    def test_LPSMarkupsFile(self):
+        filename = self.WriteFile('seeds.fcsv',
+            '# Markups fiducial file version = 4.11\n'
+            '# CoordinateSystem = LPS\n'
+            '# columns = id,x,y,z,ow,ox,oy,oz,vis,sel,lock,label,desc,associatedNodeID\n'
+            'vtkMRMLMarkupsFiducialNode_0,10.5,-20,30,0,0,0,1,1,1,0,lunate,,\n')
+
+        bones, seedPoints = ReadSeedFile(filename)
+
+        self.assertEqual(bones, ['Lunate'])
+        self.assertEqual(seedPoints, [[10.5, -20.0, 30.0]])
+
+    def test_TextFile(self):
+        filename = self.WriteFile('seeds.txt', 'Capitate, 1, 2, 3\n')
+
+        self.assertEqual(ReadSeedFile(filename), (['Capitate'], [[1.0, 2.0, 3.0]]))
+        self.assertEqual(ReadSeedFile(filename, ras=True), (['Capitate'], [[-1.0, -2.0, 3.0]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from WRISTLib.LevelSetInitialization import EllipsoidLevelSet, MaskLevelSet
+
+
+class EllipsoidLevelSetTest(unittest.TestCase):
+    def setUp(self):
+        self.image = sitk.Image([30, 30, 20], sitk.sitkInt16)
+        self.image.SetSpacing([0.5, 0.5, 1])
+
+    def test_Signs(self):
+        # Positive inside, zero on the surface, negative outside
+        levelSet = EllipsoidLevelSet(self.image, [15, 15, 10], [4, 3, 5])
+        nda = sitk.GetArrayFromImage(levelSet) # z,y,x
+
+        self.assertEqual(levelSet.GetPixelID(), sitk.sitkFloat32)
+        self.assertEqual(levelSet.GetSpacing(), self.image.GetSpacing())
+        self.assertAlmostEqual(float(nda[10, 15, 15]), 3) # The smallest radius at the center
+        self.assertAlmostEqual(float(nda[10, 15, 23]), 0) # 8 voxels (4 mm) along x
+        self.assertGreater(nda[10, 15, 20], 0)
+        self.assertLess(nda[10, 15, 26], 0)
+        self.assertLess(nda[0, 0, 0], 0)
+
+    def test_SphereIsTheSignedDistance(self):
+        levelSet = sitk.GetArrayFromImage(EllipsoidLevelSet(self.image, [15, 15, 10], [3, 3, 3]))
+        self.assertAlmostEqual(float(levelSet[10, 15, 15 + 4]), 1) # 2 mm from the center
+        self.assertAlmostEqual(float(levelSet[10 + 5, 15, 15]), -2) # 5 mm from the center
+
+    def test_NarrowBand(self):
+        levelSet = sitk.GetArrayFromImage(EllipsoidLevelSet(self.image, [15, 15, 10], [4, 3, 5], narrowBand=1))
+        self.assertEqual(float(levelSet.max()), 1)
+        self.assertEqual(float(levelSet.min()), -1)
+
+
+class MaskLevelSetTest(unittest.TestCase):
+    def test_Signs(self):
+        nda = np.zeros((20, 20, 20), dtype=np.uint8)
+        nda[5:15, 5:15, 5:15] = 1
+        mask = sitk.GetImageFromArray(nda)
+
+        levelSet = sitk.GetArrayFromImage(MaskLevelSet(mask))
+
+        self.assertTrue((levelSet[nda == 1] >= 0).all())
+        self.assertTrue((levelSet[nda == 0] < 0).all())
+        self.assertGreater(levelSet[10, 10, 10], levelSet[5, 10, 10]) # Deeper inside is larger
+
+    def test_NarrowBand(self):
+        nda = np.zeros((20, 20, 20), dtype=np.uint8)
+        nda[5:15, 5:15, 5:15] = 1
+
+        levelSet = MaskLevelSet(sitk.GetImageFromArray(nda), narrowBand=2)
+        values = sitk.GetArrayFromImage(levelSet)
+
+        self.assertEqual(levelSet.GetPixelID(), sitk.sitkFloat32)
+        self.assertEqual(float(values.max()), 2)
+        self.assertEqual(float(values.min()), -2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from WRISTLib.ParallelSegmentation import Multiprocessor
+
+
+def SyntheticVolume():
+    # Bright background with two dark (bone-like) ellipsoids side by side, 1 mm voxels
+    z, y, x = np.mgrid[0:60, 0:70, 0:80].astype(np.float32)
+    nda = np.full(z.shape, 200, dtype=np.float32)
+    for center, radii in [((25, 35, 30), (8, 6, 9)), ((46, 35, 30), (9, 7, 9))]:
+        inside = ((x - center[0])/radii[0])**2 + ((y - center[1])/radii[1])**2 + ((z - center[2])/radii[2])**2 <= 1
+        nda[inside] = 40
+    nda = nda + np.random.RandomState(0).normal(0, 5, nda.shape).astype(np.float32)
+
+    return sitk.GetImageFromArray(nda.astype(np.int16))
+
+
+class CompositeLabelTest(unittest.TestCase):
+    def setUp(self):
+        self.multiHelper = Multiprocessor()
+        self.multiHelper.MRI_Image = sitk.Image([20, 10, 10], sitk.sitkInt16)
+        self.multiHelper.labelSeeds = {3:np.asarray([4.0, 5.0, 5.0]), 4:np.asarray([14.0, 5.0, 5.0])} # Scaphoid, Capitate (x,y,z)
+
+        # Two overlapping boxes: the Scaphoid from x 0 to 12 and the Capitate from x 8 to 20
+        self.scaphoid = np.full((10, 10, 12), 3, dtype=np.uint8)
+        self.capitate = np.full((10, 10, 12), 4, dtype=np.uint8)
+
+    def Composite(self, order):
+        segmentationArray = np.zeros((10, 10, 20), dtype=np.uint16)
+        crops = {3:(self.scaphoid, [0, 0, 0]), 4:(self.capitate, [8, 0, 0])}
+        for label in order:
+            self.multiHelper.CompositeLabel(segmentationArray, crops[label][0], crops[label][1])
+        return segmentationArray
+
+    def test_TouchingBonesKeepTheirLabels(self):
+        segmentationArray = self.Composite([3, 4])
+
+        self.assertEqual(sorted(np.unique(segmentationArray).tolist()), [3, 4])
+
+        # The overlap (x 8 to 11) goes to the closest seed (the Scaphoid seed is at x 4, the Capitate seed at x 14)
+        self.assertTrue((segmentationArray[:, :, :9] == 3).all())
+        self.assertTrue((segmentationArray[:, :, 9] == 3).all()) # Tie (5 mm from both seeds) goes to the lower label
+        self.assertTrue((segmentationArray[:, :, 10:] == 4).all())
+
+    def test_OrderDoesNotMatter(self):
+        self.assertTrue(np.array_equal(self.Composite([3, 4]), self.Composite([4, 3])))
+
+    def test_BackgroundDoesNotOverwrite(self):
+        segmentationArray = self.Composite([3])
+        empty = np.zeros((10, 10, 12), dtype=np.uint8)
+        self.multiHelper.CompositeLabel(segmentationArray, empty, [8, 0, 0])
+
+        self.assertTrue(np.array_equal(segmentationArray, self.Composite([3])))
+
+
+class MultiprocessorTest(unittest.TestCase):
+    def Segment(self, image, numCPUS):
+        multiHelper = Multiprocessor()
+        multiHelper.segmentationClass.SetPreprocessingCache(None)
+        multiHelper.segmentationClass.SetDiffusionCache(None)
+
+        seedPoints = [[25.0, 35.0, 30.0], [46.0, 35.0, 30.0]]
+        parameters = [1, 0.003, 500, 2, 'Unknown', ['Lunate', 'Scaphoid'], 0, 5, True, 0]
+        segmentation = multiHelper.Execute(seedPoints, image, parameters, numCPUS)
+
+        return sitk.GetArrayFromImage(segmentation), multiHelper.results
+
+    def test_SerialAndParallelGiveTheSameLabels(self):
+        image = SyntheticVolume()
+
+        serial, serialResults = self.Segment(image, 1)
+        parallel, parallelResults = self.Segment(image, 2)
+
+        self.assertEqual(len(serialResults), 2)
+        self.assertEqual(len(parallelResults), 2)
+        self.assertTrue(np.array_equal(serial, parallel))
+        self.assertEqual(sorted(np.unique(serial).tolist()), [0, 3, 5]) # Scaphoid and Lunate
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from WRISTLib.PreprocessingCache import PreprocessingCache, DiskPreprocessingCache, DiffusionCache, ImageBytes
+
+
+def RandomImage(size, seed=0):
+    nda = np.random.RandomState(seed).rand(*size[::-1]).astype(np.float32)
+    return sitk.GetImageFromArray(nda)
+
+
+class PreprocessingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.image = RandomImage([10, 10, 10])
+        self.edgePotentialMap = RandomImage([10, 10, 10], 1)
+        self.entryBytes = ImageBytes(self.image) + ImageBytes(self.edgePotentialMap)
+
+    def test_KeySeparation(self):
+        cache = PreprocessingCache()
+        cache.Store('image', (5, 0.02), [0, 0, 0], [10, 10, 10], self.image, self.edgePotentialMap)
+
+        self.assertIsNotNone(cache.Lookup('image', (5, 0.02), [0, 0, 0], [10, 10, 10]))
+        self.assertIsNone(cache.Lookup('other image', (5, 0.02), [0, 0, 0], [10, 10, 10]))
+        self.assertIsNone(cache.Lookup('image', (6, 0.02), [0, 0, 0], [10, 10, 10]))
+        self.assertIsNone(cache.Lookup('image', (5, 0.02), [1, 0, 0], [11, 10, 10]))
+
+    def test_OnlyExactBounds(self):
+        # A smaller crop inside of a cached crop is filtered again (its diffusion differs from the slice)
+        cache = PreprocessingCache()
+        cache.Store('image', (5,), [0, 0, 0], [10, 10, 10], self.image, self.edgePotentialMap)
+
+        self.assertIsNone(cache.Lookup('image', (5,), [2, 2, 2], [8, 8, 8]))
+
+    def test_Region(self):
+        cache = PreprocessingCache()
+        cache.Store('image', (5,), [10, 20, 30], [20, 30, 40], self.image, self.edgePotentialMap)
+
+        image, edgePotentialMap = cache.Lookup('image', (5,), [10, 20, 30], [20, 30, 40], ([12, 23, 34], [15, 28, 40]))
+
+        self.assertEqual(image.GetSize(), (3, 5, 6))
+        self.assertTrue(np.array_equal(sitk.GetArrayViewFromImage(image), sitk.GetArrayViewFromImage(self.image)[4:10, 3:8, 2:5]))
+        self.assertEqual(image.GetOrigin(), self.image.TransformIndexToPhysicalPoint([2, 3, 4]))
+
+    def test_LeastRecentlyUsedEviction(self):
+        cache = PreprocessingCache(maxBytes=2*self.entryBytes)
+        for i in range(3):
+            if i == 2:
+                cache.Lookup('image', (5,), [0, 0, 0], [10, 10, 10]) # The first entry is now the most recently used
+            cache.Store('image', (5,), [i, 0, 0], [i + 10, 10, 10], self.image, self.edgePotentialMap)
+
+        self.assertEqual(cache.numBytes, 2*self.entryBytes)
+        self.assertIsNotNone(cache.Lookup('image', (5,), [0, 0, 0], [10, 10, 10]))
+        self.assertIsNone(cache.Lookup('image', (5,), [1, 0, 0], [11, 10, 10]))
+        self.assertIsNotNone(cache.Lookup('image', (5,), [2, 0, 0], [12, 10, 10]))
+
+    def test_TooLargeIsNotCached(self):
+        cache = PreprocessingCache(maxBytes=self.entryBytes - 1)
+        cache.Store('image', (5,), [0, 0, 0], [10, 10, 10], self.image, self.edgePotentialMap)
+
+        self.assertEqual(cache.numBytes, 0)
+        self.assertIsNone(cache.Lookup('image', (5,), [0, 0, 0], [10, 10, 10]))
+
+
+class DiskPreprocessingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image = RandomImage([10, 12, 20])
+        self.image.SetOrigin([1, 2, 3])
+        self.image.SetSpacing([0.5, 0.5, 2])
+        self.edgePotentialMap = RandomImage([10, 12, 20], 1)
+        self.edgePotentialMap.CopyInformation(self.image)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def CheckLookup(self, cache):
+        cache.Store('image', (5,), [10, 20, 30], [20, 32, 50], self.image, self.edgePotentialMap)
+
+        image, edgePotentialMap = cache.Lookup('image', (5,), [10, 20, 30], [20, 32, 50])
+        self.assertTrue(np.array_equal(sitk.GetArrayViewFromImage(image), sitk.GetArrayViewFromImage(self.image)))
+        self.assertTrue(np.array_equal(sitk.GetArrayViewFromImage(edgePotentialMap), sitk.GetArrayViewFromImage(self.edgePotentialMap)))
+        self.assertEqual(image.GetOrigin(), self.image.GetOrigin())
+
+        # Only exact bounds, but a region of the entry can be read
+        self.assertIsNone(cache.Lookup('image', (5,), [11, 20, 30], [19, 32, 50]))
+        image, edgePotentialMap = cache.Lookup('image', (5,), [10, 20, 30], [20, 32, 50], ([12, 21, 39], [15, 30, 48]))
+        self.assertTrue(np.array_equal(sitk.GetArrayViewFromImage(image), sitk.GetArrayViewFromImage(self.image)[9:18, 1:10, 2:5]))
+        self.assertEqual(image.GetOrigin(), self.image.TransformIndexToPhysicalPoint([2, 1, 9]))
+
+    def test_Lookup(self):
+        self.CheckLookup(DiskPreprocessingCache(self.directory))
+
+    def test_CompressedLookup(self):
+        self.CheckLookup(DiskPreprocessingCache(self.directory, compress=True, chunkSlices=4))
+
+
+class DiffusionCacheTest(unittest.TestCase):
+    def Diffuse(self, image, iterations):
+        anisotropicFilter = sitk.CurvatureAnisotropicDiffusionImageFilter()
+        anisotropicFilter.SetNumberOfIterations(iterations)
+        anisotropicFilter.SetTimeStep(0.02)
+        anisotropicFilter.SetConductanceParameter(2)
+        return anisotropicFilter.Execute(image)
+
+    def test_ContinuingGivesTheSameDiffusion(self):
+        # 5 iterations continued with 2 more equals 7 iterations at once
+        image = RandomImage([16, 16, 16])
+        cache = DiffusionCache()
+        cache.Store('crop', 5, self.Diffuse(image, 5))
+
+        done, cached = cache.Lookup('crop', 7)
+        self.assertEqual(done, 5)
+
+        continued = sitk.GetArrayFromImage(self.Diffuse(cached, 7 - done))
+        self.assertTrue(np.array_equal(continued, sitk.GetArrayFromImage(self.Diffuse(image, 7))))
+
+    def test_MostIterationsUpToTheRequest(self):
+        image = RandomImage([4, 4, 4])
+        cache = DiffusionCache()
+        for iterations in [2, 5, 9]:
+            cache.Store('crop', iterations, image)
+
+        self.assertEqual(cache.Lookup('crop', 7)[0], 5)
+        self.assertEqual(cache.Lookup('crop', 9)[0], 9)
+        self.assertEqual(cache.Lookup('crop', 1), (0, None))
+
+    def test_KeySeparation(self):
+        image = RandomImage([4, 4, 4])
+        cache = DiffusionCache()
+        cache.Store(('image', 0.02, 2), 5, image)
+
+        self.assertEqual(cache.Lookup(('image', 0.02, 3), 5), (0, None))
+        self.assertEqual(cache.Lookup(('other image', 0.02, 2), 5), (0, None))
+        self.assertEqual(cache.Lookup(('image', 0.02, 2), 5)[0], 5)
+
+    def test_LeastRecentlyUsedEviction(self):
+        image = RandomImage([4, 4, 4])
+        cache = DiffusionCache(maxBytes=2*ImageBytes(image))
+        cache.Store('a', 1, image)
+        cache.Store('b', 1, image)
+        cache.Lookup('a', 1) # a is now the most recently used
+        cache.Store('c', 1, image)
+
+        self.assertEqual(cache.Lookup('a', 1)[0], 1)
+        self.assertEqual(cache.Lookup('b', 1), (0, None))
+        self.assertEqual(cache.Lookup('c', 1)[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
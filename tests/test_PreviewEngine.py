@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+from WRISTLib.PreviewEngine import PreviewEngine
+
+
+class PreviewEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = PreviewEngine(delay=0.05)
+        self.calls = []
+
+    def tearDown(self):
+        self.engine.Close()
+
+    def Compute(self, isStale, value):
+        self.calls.append(value)
+        return value
+
+    def WaitForPreviews(self, timeout=5):
+        # Collect the finished previews until the engine is idle
+        finished = {}
+        end = time.time() + timeout
+        while time.time() < end:
+            finished.update(self.engine.Poll())
+            if not self.engine.IsBusy():
+                return finished
+            time.sleep(0.01)
+        self.fail('The previews did not finish')
+
+    def test_OnlyTheNewestRequestIsComputed(self):
+        # Requests replaced within the delay (e.g. while dragging a slider) are never started
+        for value in range(5):
+            self.engine.Request('sigmoid', self.Compute, value)
+
+        self.assertEqual(self.WaitForPreviews(), {'sigmoid':4})
+        self.assertEqual(self.calls, [4])
+
+    def test_StaleResultIsDropped(self):
+        started = threading.Event()
+        release = threading.Event()
+        stale = []
+
+        def Slow(isStale, value):
+            started.set()
+            release.wait(5)
+            stale.append(isStale())
+            return value
+
+        self.engine.Request('diffusion', Slow, 1)
+        self.assertTrue(started.wait(5))
+
+        # A newer request arrives while the first one is running
+        self.engine.Request('diffusion', self.Compute, 2)
+        release.set()
+
+        self.assertEqual(self.WaitForPreviews(), {'diffusion':2})
+        self.assertEqual(stale, [True])
+
+    def test_SeparateNames(self):
+        self.engine.Request('sigmoid', self.Compute, 1)
+        self.engine.Request('diffusion', self.Compute, 2)
+
+        self.assertEqual(self.WaitForPreviews(), {'sigmoid':1, 'diffusion':2})
+
+    def test_CloseStopsTheThread(self):
+        self.engine.Request('sigmoid', self.Compute, 1)
+        thread = self.engine.thread
+
+        self.engine.Close()
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.engine.thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
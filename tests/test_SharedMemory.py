@@ -0,0 +1,50 @@
+import os
+import pickle
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+from WRISTLib.SharedMemory import SharedVolume
+
+
+class SharedVolumeTest(unittest.TestCase):
+    def setUp(self):
+        self.nda = np.arange(4*5*6, dtype=np.int16).reshape(4, 5, 6) # z,y,x
+        self.image = sitk.GetImageFromArray(self.nda)
+        self.image.SetOrigin([1, 2, 3])
+        self.image.SetSpacing([0.5, 0.5, 2])
+
+    def test_CloseRemovesTheFile(self):
+        sharedVolume = SharedVolume(self.image)
+        self.assertTrue(os.path.exists(sharedVolume.filename))
+
+        sharedVolume.Close()
+        self.assertFalse(os.path.exists(sharedVolume.filename))
+
+        sharedVolume.Close() # Closing twice is fine
+
+    def test_CopyDoesNotRemoveTheFile(self):
+        # Only the process that created the file removes it (the workers get a pickled copy)
+        sharedVolume = SharedVolume(self.image)
+        try:
+            copy = pickle.loads(pickle.dumps(sharedVolume))
+            copy.Close()
+            self.assertTrue(os.path.exists(sharedVolume.filename))
+        finally:
+            sharedVolume.Close()
+
+    def test_GetCrop(self):
+        sharedVolume = SharedVolume(self.image)
+        try:
+            crop = sharedVolume.GetCrop([1, 2, 1], [4, 5, 3])
+
+            self.assertTrue(np.array_equal(sitk.GetArrayViewFromImage(crop), self.nda[1:3, 2:5, 1:4]))
+            self.assertEqual(crop.GetOrigin(), self.image.TransformIndexToPhysicalPoint([1, 2, 1]))
+            self.assertEqual(crop.GetSpacing(), self.image.GetSpacing())
+        finally:
+            sharedVolume.Close()
+
+
+if __name__ == '__main__':
+    unittest.main()